@@ -0,0 +1,57 @@
+"""
+Compare the cold start of a stats-only run of cli.py with the import of plots.py, measured with python -X importtime.
+
+For every entry point a fresh interpreter imports the modules, and the cumulative import time of the top level imports
+is summed from the -X importtime report. The number of modules and whether matplotlib was imported are also reported.
+Run from the root of the repository:
+    python benchmarks/bench_importtime.py --repeat 5
+"""
+
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ENTRY_POINTS = {
+    "cli.py --help": "import cli",
+    "cli.py stats": "import cli, cache, dataset",
+    "plots.py": "import plots",
+}
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_time(statement: str):
+    """Return (cumulative import time of the top level imports in seconds, imported modules) of a statement"""
+
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT, capture_output=True,
+                            text=True, check=True, env=dict(os.environ, MPLBACKEND="Agg"))
+    total = 0
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            modules.append(match.group(4))
+            if not match.group(3):  # not indented: imported by the statement itself
+                total += int(match.group(2))
+    return total / 1e6, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per entry point, the best time is kept")
+    args = parser.parse_args()
+
+    print("{:<16}{:>12}{:>10}{:>12}".format("entry point", "import [s]", "modules", "matplotlib"))
+    for name, statement in ENTRY_POINTS.items():
+        runs = [import_time(statement) for _ in range(args.repeat)]
+        seconds = min(seconds for seconds, _ in runs)
+        modules = runs[0][1]
+        matplotlib = any(module.split(".")[0] == "matplotlib" for module in modules)
+        print("{:<16}{:>12.3f}{:>10}{:>12}".format(name, seconds, len(modules), "yes" if matplotlib else "no"))
+
+
+if __name__ == "__main__":
+    main()
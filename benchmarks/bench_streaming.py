@@ -0,0 +1,63 @@
+"""
+Compare peak memory and time of the json.load and the streaming parsers on one large Datumaro file.
+
+The large file is a synthetic tray (see synthetic.py) with a long time-lapse.
+Run from the root of the repository:
+    python benchmarks/bench_streaming.py --frames 4000 --tracks-per-frame 150
+"""
+
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pipeline import read_tray_columns  # noqa: E402
+from streaming import iter_frames  # noqa: E402
+from synthetic import write_tray  # noqa: E402
+
+
+def measure(function):
+    """Return (seconds, peak traced MB) of a call of function"""
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 1e6
+
+
+def count_samples_streaming(file_name: str):
+    """Aggregate without materializing the tray"""
+
+    return sum(len(record.track_ids) for record in iter_frames(file_name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--tracks-per-frame", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, "large.json")
+        write_tray(file_name, frames=args.frames, tracks_per_frame=args.tracks_per_frame)
+        print("file size: {:.1f} MB".format(os.path.getsize(file_name) / 1e6))
+        print("{:<28}{:>10}{:>16}".format("parser", "time [s]", "peak mem [MB]"))
+        for name, function in [
+            ("json.load", lambda: read_tray_columns(file_name)),
+            ("streaming columns", lambda: read_tray_columns(file_name, stream=True)),
+            ("streaming count_samples", lambda: count_samples_streaming(file_name)),
+        ]:
+            seconds, peak = measure(function)
+            print("{:<28}{:>10.2f}{:>16.1f}".format(name, seconds, peak))
+
+
+if __name__ == "__main__":
+    main()
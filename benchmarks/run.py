@@ -0,0 +1,137 @@
+"""
+Benchmark suite of the loading and statistics pipeline on synthetic datasets of increasing size.
+
+For every scale a synthetic dataset is generated (see synthetic.py) and the suite measures:
+    * parse: reading the JSON files into columns (pipeline.read_tray_columns)
+    * index: building the trays from the columns (frame views, TrackIndex, time stamps)
+    * aggregate: the statistics of plots.py, through dataset.Dataset
+    * peak_mb: peak traced memory of parse + index + aggregate, measured in a separate run
+The results are written as JSON, and --compare prints the relative change against a previous result file.
+
+Run from the root of the repository:
+    python benchmarks/run.py --scales small medium --output bench_results.json --compare old_results.json
+"""
+
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import numpy as np  # noqa: E402
+
+from dataset import Dataset  # noqa: E402
+from pipeline import Specie, Tray, list_tray_files, read_tray_columns  # noqa: E402
+from synthetic import write_dataset  # noqa: E402
+
+SCALES = {
+    "small": {"species": 2, "trays": 5, "frames": 50, "tracks_per_frame": 10},
+    "medium": {"species": 3, "trays": 10, "frames": 200, "tracks_per_frame": 30},
+    "large": {"species": 4, "trays": 20, "frames": 400, "tracks_per_frame": 60},
+    "xlarge": {"species": 6, "trays": 40, "frames": 800, "tracks_per_frame": 100},
+}
+STAGES = ("parse", "index", "aggregate")
+
+
+def run_pipeline(directories: list, timings=None):
+    """Parse, index and aggregate the species directories, adding the seconds of every stage to timings"""
+
+    timings = timings if timings is not None else {}
+    start = time.perf_counter()
+    columns = {directory: [(file_name, read_tray_columns(file_name)) for file_name in list_tray_files(directory)]
+               for directory in directories}
+    parsed = time.perf_counter()
+    species = [Specie(directory, trays=[Tray(file_name, c) for file_name, c in columns[directory]])
+               for directory in directories]
+    indexed = time.perf_counter()
+    dataset = Dataset(species)
+    for by in [(), ("species",), ("species", "tray"), ("species", "label")]:
+        dataset.query(by)
+    aggregated = time.perf_counter()
+    timings["parse"] = parsed - start
+    timings["index"] = indexed - parsed
+    timings["aggregate"] = aggregated - indexed
+    return dataset
+
+
+def benchmark_scale(name: str, parameters: dict, repeat: int):
+    """Generate the dataset of one scale and return its measurements (best of repeat runs)"""
+
+    with tempfile.TemporaryDirectory() as directory:
+        directories = write_dataset(directory, **parameters)
+        size = sum(os.path.getsize(f) for d in directories for f in list_tray_files(d))
+        best = {stage: float("inf") for stage in STAGES}
+        for _ in range(repeat):
+            timings = {}
+            dataset = run_pipeline(directories, timings)
+            best = {stage: min(best[stage], timings[stage]) for stage in STAGES}
+        tracemalloc.start()
+        run_pipeline(directories)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    totals = dataset.query(())[0]
+    result = dict(parameters, scale=name, bytes=size, boxes=totals["samples"], tracks=totals["tracks"],
+                  frames=totals["frames"], peak_mb=peak / 1e6)
+    result.update(best)
+    return result
+
+
+def environment():
+    """Return a description of the machine and of the version of the code"""
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "commit": commit, "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results: list, previous_file: str):
+    """Print the relative change of every stage against the results of a previous run"""
+
+    with open(previous_file) as f:
+        previous = {r["scale"]: r for r in json.load(f)["results"]}
+    print("\nchange against {} (negative is faster / smaller):".format(previous_file))
+    for result in results:
+        old = previous.get(result["scale"])
+        if old is None:
+            continue
+        changes = ["{} {:+.0%}".format(key, result[key] / old[key] - 1)
+                   for key in STAGES + ("peak_mb",) if old.get(key)]
+        print("{:<8}{}".format(result["scale"], ", ".join(changes)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", default=["small", "medium", "large"], choices=sorted(SCALES))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scale, the best time is kept")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file with the results")
+    parser.add_argument("--compare", default=None, help="JSON file of a previous run")
+    args = parser.parse_args()
+
+    results = []
+    print("{:<8}{:>10}{:>10}{:>10}{:>11}{:>11}{:>11}{:>10}".format(
+        "scale", "MB", "boxes", "tracks", "parse [s]", "index [s]", "aggr. [s]", "peak MB"))
+    for name in args.scales:
+        result = benchmark_scale(name, SCALES[name], args.repeat)
+        results.append(result)
+        print("{:<8}{:>10.1f}{:>10}{:>10}{:>11.3f}{:>11.3f}{:>11.3f}{:>10.1f}".format(
+            name, result["bytes"] / 1e6, result["boxes"], result["tracks"], result["parse"], result["index"],
+            result["aggregate"], result["peak_mb"]))
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=1)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
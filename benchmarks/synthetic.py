@@ -0,0 +1,107 @@
+"""
+Generator of synthetic CVAT/Datumaro datasets with the same shape as the bundled species directories.
+
+Every tray is a JSON file with "info", "categories" and "items". Every item has an "id" with the time stamp of the
+frame (e.g. SYNTH/100000/SYNTH_100000_2021Y07M01D_14H43M56S_img), "attr": {"frame": n} and bbox "annotations" with
+a track_id and a label_id. Tracks germinate at random frames, grow and die, so the trays have realistic life spans.
+
+Example, from the root of the repository:
+    python benchmarks/synthetic.py /tmp/synthetic --species 3 --trays 10 --frames 200 --tracks-per-frame 40
+"""
+
+
+import argparse
+import datetime
+import json
+import os
+
+import numpy as np
+
+START = datetime.datetime(2021, 7, 1, 14, 43, 56)
+FRAME_INTERVAL = datetime.timedelta(hours=6)
+
+
+def tray_items(species: str, tray_number: int, frames: int, tracks_per_frame: int, wrong_fraction: float, rng):
+    """Yield the items of one synthetic tray
+
+    Parameters:
+        species: name of the species, used in the frame ids
+        tray_number: number of the tray, used in the frame ids
+        frames: number of frames (items)
+        tracks_per_frame: average number of bboxes per frame
+        wrong_fraction: fraction of the tracks labelled as a different plant (label_id 1)
+        rng: numpy.random.Generator
+    """
+
+    # every track lives for about half of the tray, so about 2 * tracks_per_frame tracks give the requested density
+    number_of_tracks = max(1, 2 * tracks_per_frame)
+    birth = rng.integers(0, max(1, frames // 2), number_of_tracks)
+    death = np.minimum(frames - 1, birth + rng.integers(1, max(2, frames), number_of_tracks))
+    labels = (rng.random(number_of_tracks) < wrong_fraction).astype(int)
+    x = rng.uniform(0, 1900, number_of_tracks)
+    y = rng.uniform(0, 1900, number_of_tracks)
+    size = rng.uniform(10, 40, number_of_tracks)
+    for frame in range(frames):
+        time = START + frame * FRAME_INTERVAL
+        alive = np.flatnonzero((birth <= frame) & (frame <= death))
+        annotations = []
+        for track in alive:
+            side = size[track] * (1 + 0.05 * (frame - birth[track]))  # the plant grows
+            annotations.append({
+                "id": 0, "type": "bbox",
+                "attributes": {"occluded": False, "rotation": 0.0, "track_id": int(track), "keyframe": True},
+                "group": 0, "label_id": int(labels[track]), "z_order": 0,
+                "bbox": [round(float(x[track] + rng.normal(0, 2)), 2), round(float(y[track] + rng.normal(0, 2)), 2),
+                         round(float(side), 2), round(float(side * rng.uniform(0.8, 1.2)), 2)],
+            })
+        yield {"id": "{0}/{1}/{0}_{1}_{2}_img".format(species, tray_number, time.strftime("%YY%mM%dD_%HH%MM%SS")),
+               "annotations": annotations, "attr": {"frame": frame}}
+
+
+def write_tray(file_name: str, species="SYNTH", tray_number=100000, frames=100, tracks_per_frame=20,
+               wrong_fraction=0.05, seed=0):
+    """Write one synthetic tray to file_name, item by item, see tray_items for the parameters"""
+
+    rng = np.random.default_rng(seed)
+    categories = {"label": {"labels": [{"name": species, "parent": "", "attributes": []},
+                                       {"name": "differentPlant", "parent": "", "attributes": []}],
+                            "attributes": ["occluded"]}}
+    with open(file_name, "w") as f:
+        f.write('{"info": {}, "categories": ' + json.dumps(categories) + ', "items": [')
+        for i, element in enumerate(tray_items(species, tray_number, frames, tracks_per_frame, wrong_fraction, rng)):
+            f.write(("," if i else "") + json.dumps(element))
+        f.write("]}")
+
+
+def write_dataset(directory: str, species=3, trays=10, frames=100, tracks_per_frame=20, wrong_fraction=0.05, seed=0):
+    """Write a synthetic dataset with one sub directory per species and return the list of the species directories"""
+
+    directories = []
+    for s in range(species):
+        name = "SYN{:02d}".format(s)
+        species_directory = os.path.join(directory, name)
+        os.makedirs(species_directory, exist_ok=True)
+        for t in range(trays):
+            tray_number = 100000 + 1000 * s + t
+            write_tray(os.path.join(species_directory, "{}_{}.json".format(name, tray_number)), name, tray_number,
+                       frames, tracks_per_frame, wrong_fraction, seed=seed + 1000 * s + t)
+        directories.append(species_directory)
+    return directories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--species", type=int, default=3)
+    parser.add_argument("--trays", type=int, default=10, help="trays per species")
+    parser.add_argument("--frames", type=int, default=100, help="frames per tray")
+    parser.add_argument("--tracks-per-frame", type=int, default=20)
+    parser.add_argument("--wrong-fraction", type=float, default=0.05, help="fraction of tracks with label_id 1")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_dataset(args.directory, args.species, args.trays, args.frames, args.tracks_per_frame, args.wrong_fraction,
+                  args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Persistent on-disk cache of parsed trays.
+
+Parsing a Datumaro JSON file is by far the most expensive step of loading a Tray, while the annotation files almost
+never change between runs. TrayCache stores the columns of every parsed tray (see pipeline.read_tray_columns) as an
+uncompressed .npz sidecar in a cache directory, so later runs read the NumPy arrays instead of calling json.load.
+
+An entry is only used if it was written by the same CACHE_FORMAT_VERSION and if the path, size and modification time
+of the JSON file (and optionally the SHA-1 of its content) still match. Re-exporting a file from CVAT therefore
+invalidates its entry. The cache directory is bounded to max_bytes, the least recently used entries are evicted first:
+store evicts as soon as the entries it wrote would pass max_bytes, whichever code path parses the trays. Processes
+sharing a directory each count their own writes, so the bound is only approximate while several processes write.
+"""
+
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from instrument import OFF_VALUES
+
+CACHE_FORMAT_VERSION = 1
+DEFAULT_CACHE_DIRECTORY = ".staticrops_cache"
+EVICT_FRACTION = 0.1  # store evicts down to (1 - EVICT_FRACTION) * max_bytes, so it does not scan on every store
+
+
+def file_digest(file_name: str):
+    """Return the SHA-1 hex digest of the content of a file"""
+
+    digest = hashlib.sha1()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TrayCache:
+    def __init__(self, directory: str = DEFAULT_CACHE_DIRECTORY, max_bytes: int = 1 << 30, content_hash=False):
+        """Initializes a cache of parsed trays
+
+        Parameters:
+            directory: directory where the .npz entries are stored, it is created if it does not exist
+            max_bytes: maximum total size of the entries, see evict
+            content_hash: if True an entry is also checked against the SHA-1 of the content of the JSON file. This
+                reads the whole file on every load, but detects changes that keep the size and modification time.
+        """
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.content_hash = content_hash
+        self.free_bytes = None  # bytes that can be stored before the cache is full, None until the first evict
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_name(self, file_name: str):
+        """Return the name of the .npz entry of a JSON file"""
+
+        key = hashlib.sha1(os.path.abspath(file_name).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".npz")
+
+    def signature(self, file_name: str):
+        """Return the dictionary that identifies the current version of a JSON file"""
+
+        stat = os.stat(file_name)
+        signature = {"version": CACHE_FORMAT_VERSION, "path": os.path.abspath(file_name),
+                     "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if self.content_hash:
+            signature["sha1"] = file_digest(file_name)
+        return signature
+
+    def load(self, file_name: str):
+        """Return the cached columns of a JSON file, or None if there is no valid entry"""
+
+        entry = self.entry_name(file_name)
+        try:
+            with np.load(entry, allow_pickle=False) as data:
+                if json.loads(str(data["signature"])) != self.signature(file_name):
+                    return None
+                columns = {key: data[key] for key in data.files if key != "signature"}
+        except FileNotFoundError:
+            return None
+        except Exception:  # truncated or foreign entry, it is rewritten by the next store
+            return None
+        columns["plant_ids"] = columns["plant_ids"].tolist()
+        try:
+            os.utime(entry)  # mark the entry as recently used for evict
+        except OSError:
+            pass
+        return columns
+
+    def store(self, file_name: str, columns: dict, signature=None):
+        """Write the columns of a JSON file to the cache
+
+        Parameters:
+            file_name: name of the parsed JSON file
+            columns: columns returned by pipeline.columns_from_items
+            signature: signature of file_name taken before it was parsed. Taking it before parsing makes sure an
+                entry is never valid for a file that changed while it was parsed.
+        """
+
+        if signature is None:
+            signature = self.signature(file_name)
+        entry = self.entry_name(file_name)
+        temporary = "{}.{}.tmp.npz".format(entry[:-4], os.getpid())
+        arrays = dict(columns)
+        arrays["plant_ids"] = np.array(columns["plant_ids"], dtype=str)
+        arrays["signature"] = np.array(json.dumps(signature, sort_keys=True))
+        np.savez(temporary, **arrays)
+        size = os.path.getsize(temporary)
+        os.replace(temporary, entry)  # atomic, concurrent readers never see a partial entry
+        if self.free_bytes is None or size > self.free_bytes:
+            self.evict(int(self.max_bytes * (1 - EVICT_FRACTION)))
+        else:
+            self.free_bytes -= size
+
+    def entries(self):
+        """Return a list of (last use, size, name) of the entries, the least recently used first"""
+
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".npz") and ".tmp." not in entry.name:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self, max_bytes=None):
+        """Remove the least recently used entries until the cache is not larger than max_bytes (self.max_bytes by
+        default)"""
+
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.free_bytes = self.max_bytes - total
+
+    def clear(self):
+        """Remove all the entries"""
+
+        for _, _, name in self.entries():
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+        self.free_bytes = None
+
+
+def default_cache():
+    """Return the TrayCache configured by the STATICROPS_CACHE environment variable
+
+    STATICROPS_CACHE can be the cache directory (default .staticrops_cache) or "off" to disable the cache, in which
+    case None is returned.
+    """
+
+    directory = os.environ.get("STATICROPS_CACHE", DEFAULT_CACHE_DIRECTORY)
+    if directory.lower() in OFF_VALUES:
+        return None
+    return TrayCache(directory)
@@ -0,0 +1,144 @@
+"""
+Command line entry point for scheduled jobs.
+
+    python cli.py stats [directories] [--by species label] [--where label=0] [--format json|csv]
+    python cli.py trays [directories] [--format json|csv]
+    python cli.py plot [directories] --output report [--annotation-times csv_files/annotation_time.csv]
+
+stats and trays print the statistics of dataset.Dataset as JSON or CSV rows and never import matplotlib: the modules
+are imported by the subcommand that needs them, so a stats-only run starts quickly (see benchmarks/bench_importtime.py).
+plot renders the figures of plots.py to image files with render.py. Without directories, the species of plots.py are
+used; --snapshot reads a snapshot file (see snapshot.py) and --partials merges partial aggregate files (see
+partials.py) instead of the JSON files.
+"""
+
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+DEFAULT_SPECIES = ["ZEAMX", "SORXX", "ALOMY", "AGRRE", "ECHCG", "POAAN"]
+GROUP_KEYS = ("species", "tray", "label")  # see dataset.GROUP_KEYS, not imported to keep --help fast
+
+
+def load_dataset(args):
+    """Return the dataset.Dataset of the directories, snapshot or partial aggregates of the command line arguments"""
+
+    if args.snapshot:
+        from snapshot import Snapshot
+
+        return Snapshot(args.snapshot).dataset()
+    if args.partials:
+        from dataset import Dataset
+        from partials import read_partials
+
+        return Dataset(read_partials(args.partials))
+    from cache import default_cache
+    from dataset import Dataset
+
+    return Dataset.load(args.directories or DEFAULT_SPECIES, args.workers, default_cache(), args.stream)
+
+
+def write_rows(rows: list, output_format: str, output=None):
+    """Write a list of dictionaries as a JSON array or as CSV with a header"""
+
+    output = output or sys.stdout
+    if output_format == "csv":
+        writer = csv.DictWriter(output, list(rows[0]) if rows else [], lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        json.dump(rows, output, indent=1)
+        output.write("\n")
+
+
+def parse_where(items: list):
+    """Return the dictionary of a list of "key=value" filters, the value of label is an int"""
+
+    where = {}
+    for item in items or []:
+        key, separator, value = item.partition("=")
+        if not separator or key not in GROUP_KEYS:
+            raise argparse.ArgumentTypeError("invalid filter {!r}, expected species=, tray= or label=".format(item))
+        if key == "label":
+            try:
+                value = int(value)
+            except ValueError:
+                raise argparse.ArgumentTypeError("invalid filter {!r}, the label must be an integer".format(item))
+        where[key] = value
+    return where
+
+
+def check_where(dataset, where: dict):
+    """Raise argparse.ArgumentTypeError if a species or tray of the filters is not in the dataset"""
+
+    if "species" in where and where["species"] not in dataset.species_names:
+        raise argparse.ArgumentTypeError("unknown species {!r} in --where, expected one of {}".format(
+            where["species"], ", ".join(dataset.species_names)))
+    if "tray" in where and where["tray"] not in dataset.tray_names:
+        raise argparse.ArgumentTypeError("unknown tray {!r} in --where".format(where["tray"]))
+
+
+def command_stats(args):
+    where = parse_where(args.where)  # before loading the dataset, so a typo fails fast
+    dataset = load_dataset(args)
+    check_where(dataset, where)
+    write_rows(dataset.query(tuple(args.by), where), args.format)
+
+
+def command_trays(args):
+    rows = load_dataset(args).query(("species", "tray"))
+    for row in rows:
+        row["mean_life_span_hours"] = row["life_span_hours_sum"] / row["life_spans"] if row["life_spans"] else None
+    write_rows(rows, args.format)
+
+
+def command_plot(args):
+    from render import figure_jobs, render_figures
+
+    os.makedirs(args.output, exist_ok=True)
+    trays = not (args.no_trays or args.partials)  # partial aggregates do not have the bboxes of the trays
+    jobs = figure_jobs(load_dataset(args), args.annotation_times, trays)
+    status = render_figures(jobs, args.output, args.workers, args.force)
+    write_rows([{"figure": name, "status": value} for name, value in sorted(status.items())], args.format)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Statistics and plots of the annotated species")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("directories", nargs="*", help="species directories, by default " + " ".join(DEFAULT_SPECIES))
+    common.add_argument("--snapshot", default=None, help="read a snapshot file instead of the directories")
+    common.add_argument("--partials", nargs="+", default=None,
+                        help="read and merge partial aggregate files (see partials.py) instead of the directories")
+    common.add_argument("--workers", type=int, default=None, help="number of processes")
+    common.add_argument("--stream", action="store_true", help="parse the JSON files with bounded memory")
+    common.add_argument("--format", choices=("json", "csv"), default="json")
+
+    stats = subparsers.add_parser("stats", parents=[common], help="statistics grouped by species, tray or label")
+    stats.add_argument("--by", nargs="*", choices=GROUP_KEYS, default=["species"],
+                       help="group keys, none for the totals")
+    stats.add_argument("--where", nargs="*", default=[], help="filters, e.g. species=ZEAMX label=0")
+    stats.set_defaults(function=command_stats)
+
+    trays = subparsers.add_parser("trays", parents=[common], help="one row of statistics per tray")
+    trays.set_defaults(function=command_trays)
+
+    plot = subparsers.add_parser("plot", parents=[common], help="render the plots to image files")
+    plot.add_argument("--output", default="report", help="output directory")
+    plot.add_argument("--annotation-times", default=None, help="CSV file with the annotation times")
+    plot.add_argument("--no-trays", action="store_true", help="skip the plots that need the bboxes of the trays")
+    plot.add_argument("--force", action="store_true", help="render also the figures that did not change")
+    plot.set_defaults(function=command_plot)
+
+    args = parser.parse_args(argv)
+    try:
+        args.function(args)
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,159 @@
+"""
+Annotation times of the trays, read from a ";" delimited CSV file with one "H:MM;TRAY_ID" row per annotation task,
+e.g. "0:07;ZEAMX_127827".
+
+The tray ids are normalized (see normalize_tray_id) so that typos of the species prefix such as ZAMX_127820 and the
+file names of the trays such as ZEAMX2_127820 give the same id. join_annotation_times streams the rows of the file
+and joins them with the statistics of the trays (boxes, tracks, frames) through a dictionary indexed by tray id.
+Rows without a matching tray or with a malformed time are reported, not dropped.
+
+Run from the root of the repository to write the boxes annotated per hour of every task:
+    python -m csv_files.annotation_times csv_files/annotation_time.csv ZEAMX SORXX ALOMY AGRRE --output throughput.csv
+"""
+
+
+import argparse
 import csv
+import sys
+from collections import namedtuple
+
+SPECIES_ALIASES = {"ZAMX": "ZEAMX", "ZEAMX2": "ZEAMX"}  # typos and variants of the species prefix
+
+AnnotationTime = namedtuple("AnnotationTime", ["line", "tray_id", "minutes", "error"])
+THROUGHPUT_COLUMNS = ("line", "tray_id", "species", "tray", "minutes", "boxes", "tracks", "frames", "boxes_per_hour")
+
+
+def parse_minutes(text: str):
+    """Return the number of minutes of a "H:MM" time, raise ValueError if it is malformed"""
+
+    hours, minutes = text.strip().split(":")
+    hours, minutes = int(hours), int(minutes)
+    if hours < 0 or not 0 <= minutes < 60:
+        raise ValueError("invalid time " + text)
+    return 60 * hours + minutes
+
+
+def normalize_species(name: str):
+    """Return the species of a species prefix, e.g. ZAMX -> ZEAMX"""
+
+    name = name.upper().strip()
+    return SPECIES_ALIASES.get(name, name)
+
+
+def normalize_tray_id(name: str):
+    """Return the normalized id of a tray, e.g. "zamx_127820 ", "ZEAMX2_127820" -> "ZEAMX_127820" """
+
+    species, _, number = name.strip().partition("_")
+    return normalize_species(species) + "_" + number.strip() if number else normalize_species(species)
+
+
+def iter_annotation_times(file_name: str):
+    """Yield an AnnotationTime (line number, normalized tray id, minutes, error) for every row of the CSV file
+
+    The file is read row by row. For a malformed row, minutes is None and error describes the problem.
+    """
+
+    with open(file_name, encoding="utf-8-sig", newline="") as f:
+        for line, row in enumerate(csv.reader(f, delimiter=";"), 1):
+            if not row or not "".join(row).strip():
+                continue
+            if len(row) < 2:
+                yield AnnotationTime(line, None, None, "expected TIME;TRAY_ID, got " + ";".join(row))
+                continue
+            try:
+                yield AnnotationTime(line, normalize_tray_id(row[1]), parse_minutes(row[0]), None)
+            except ValueError:
+                yield AnnotationTime(line, normalize_tray_id(row[1]), None, "malformed time " + row[0])
+
+
+def annotation_minutes_per_species(file_name: str):
+    """Return a dictionary {species: [annotation time of every task in minutes]}, malformed rows are skipped"""
+
+    minutes_per_species = {}
+    for row in iter_annotation_times(file_name):
+        if row.minutes is not None:
+            species = row.tray_id.partition("_")[0]
+            minutes_per_species.setdefault(species, []).append(row.minutes)
+    return minutes_per_species
+
 
 def dictionary_annotations_time_per_species(file_name: str):
-    """Bar plot, y = time [hr] used for the annotation, x = species"""
-    with open(file_name, encoding='utf-8-sig') as f:
-        reader = csv.reader(f, delimiter=";")
-        data = [row for row in reader]
-    annotation_time_for_species = {}
-    for line in data:
-        annotation_time = line[0]
-        name = line[1].split("_")[0]
-        specie = name.upper().strip()
-        if specie in annotation_time_for_species:
-            annotation_time_for_species[specie].append(annotation_time)
-        else:
-            annotation_time_for_species[specie] = [annotation_time]
-    return annotation_time_for_species
+    """Return a dictionary {species: ["H:MM" annotation time of every task]}, see annotation_minutes_per_species"""
+
+    return {species: ["{}:{:02d}".format(*divmod(minutes, 60)) for minutes in values]
+            for species, values in annotation_minutes_per_species(file_name).items()}
+
+
+def tray_statistics_index(species: list):
+    """Return a dictionary {normalized tray id: statistics of the tray} of all the trays of the species
+
+    Parameters:
+        species: list of pipeline.Specie instances or a dataset.Dataset
+    """
+
+    species = getattr(species, "species", species)
+    index = {}
+    for specie in species:
+        for tray in specie.trays:
+            index[normalize_tray_id(tray.name)] = {"species": specie.name, "tray": tray.name,
+                                                   "boxes": tray.count_samples(), "tracks": len(tray.tracks),
+                                                   "frames": len(tray.plant_ids)}
+    return index
+
+
+def join_annotation_times(file_name: str, species: list, unmatched=None):
+    """Yield one row per annotation task of the CSV file that matches a tray of the species
+
+    Every row is a dictionary with the THROUGHPUT_COLUMNS: line of the CSV file, normalized tray id, species and name
+    of the tray, annotation time in minutes, boxes, tracks and frames of the tray, and boxes annotated per hour (None
+    if the time is 0).
+
+    Parameters:
+        file_name: CSV file with the annotation times
+        species: list of pipeline.Specie instances or a dataset.Dataset
+        unmatched: list to which the AnnotationTime of the rows without a tray or with a malformed time are appended,
+            with the reason in error
+    """
+
+    index = tray_statistics_index(species)
+    for row in iter_annotation_times(file_name):
+        statistics = index.get(row.tray_id)
+        if row.error is None and statistics is None:
+            row = row._replace(error="unknown tray " + str(row.tray_id))
+        if row.error is not None:
+            if unmatched is not None:
+                unmatched.append(row)
+            continue
+        boxes_per_hour = 60 * statistics["boxes"] / row.minutes if row.minutes else None
+        yield dict(statistics, line=row.line, tray_id=row.tray_id, minutes=row.minutes, boxes_per_hour=boxes_per_hour)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Join the annotation times with the statistics of the trays")
+    parser.add_argument("file_name", help="CSV file with the annotation times")
+    parser.add_argument("directories", nargs="+", help="species directories")
+    parser.add_argument("--output", default=None, help="CSV file of the joined rows, standard output by default")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes to parse the trays")
+    args = parser.parse_args()
 
-#print(dictionary_annotations_time_per_species("ej.csv_files"))
+    from cache import default_cache
+    from pipeline import load_species
 
+    species = load_species(args.directories, args.workers, default_cache())
+    unmatched = []
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(output, THROUGHPUT_COLUMNS, delimiter=";", extrasaction="ignore")
+        writer.writeheader()
+        for row in join_annotation_times(args.file_name, species, unmatched):
+            writer.writerow(row)
+    finally:
+        if args.output:
+            output.close()
+    for row in unmatched:
+        print("{}:{}: {}".format(args.file_name, row.line, row.error), file=sys.stderr)
+    print("{} unmatched rows".format(len(unmatched)), file=sys.stderr)
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+One-pass aggregation engine over the trays of many species.
+
+Dataset walks every tray of every species once and keeps the additive statistics in two small column tables:
+    * one row per (species, tray, label): samples (bboxes), tracks, correct_plants, wrong_plants, area_sum,
+      life_spans, life_span_hours_sum and life_span_days_sum (life spans of the correct plants only, like TrayStats,
+      so they are 0 in the rows of the other labels)
+    * one row per tray: frames and plants (as counted by Tray.number_plants)
+Every grouped statistic is then a query over these tables (see Dataset.query) instead of another traversal of the
+species, trays, frames and bboxes.
+"""
+
+
+import numpy as np
+
+import instrument
+from histogram import area_histogram
+from pipeline import load_species
+
+GROUP_KEYS = ("species", "tray", "label")
+LABEL_COLUMNS = ("samples", "tracks", "correct_plants", "wrong_plants", "area_sum", "life_spans",
+                 "life_span_hours_sum", "life_span_days_sum")
+TRAY_COLUMNS = ("trays", "frames", "plants")
+FLOAT_COLUMNS = ("area_sum", "life_span_hours_sum")
+
+
+def tray_label_rows(tray):
+    """Return (labels, {column: array}) with the LABEL_COLUMNS of a Tray, one entry per label of the tray
+
+    Objects that store these rows instead of the bboxes (partials.TrayPartial) return them from a label_rows method.
+    """
+
+    if hasattr(tray, "label_rows"):
+        return tray.label_rows()
+    tracks = tray.tracks
+    labels = np.union1d(tray.label_ids, tracks.label_ids)
+    bbox_position = np.searchsorted(labels, tray.label_ids)
+    track_position = np.searchsorted(labels, tracks.label_ids)
+    hours = tray.life_spans("h", False)
+    valid = ~np.isnan(hours) & (tracks.label_ids == 0)  # the life spans of the correct plants, see TrayStats
+    n = len(labels)
+    number_of_tracks = np.bincount(track_position, minlength=n)
+    columns = {
+        "samples": np.bincount(bbox_position, minlength=n),
+        "tracks": number_of_tracks,
+        "correct_plants": np.where(labels == 0, number_of_tracks, 0),
+        "wrong_plants": np.where(labels != 0, number_of_tracks, 0),
+        "area_sum": np.bincount(bbox_position, weights=tray.bbox_areas(), minlength=n),
+        "life_spans": np.bincount(track_position[valid], minlength=n),
+        "life_span_hours_sum": np.bincount(track_position[valid], weights=hours[valid], minlength=n),
+        "life_span_days_sum": np.bincount(track_position[valid], weights=np.floor(hours[valid] / 24),
+                                          minlength=n).astype(np.int64),
+    }
+    return labels, columns
+
+
+class Dataset:
+    def __init__(self, species: list):
+        """Aggregate the statistics of a list of species in a single pass over their trays
+
+        Parameters:
+            species: list of pipeline.Specie or partials.SpeciePartial instances
+        """
+
+        with instrument.stage("dataset"):
+            self._aggregate(species)
+
+    def _aggregate(self, species: list):
+        """Build the label and tray tables in one pass over the trays of the species"""
+
+        self.species = list(species)
+        self.species_names = [specie.name for specie in self.species]
+        self.tray_names = []  # name of every tray, the tray keys of the tables are indices in this list
+        tray_species = []
+        tray_columns = {"frames": [], "plants": []}
+        label_keys = {"species": [], "tray": [], "label": []}
+        label_columns = {column: [] for column in LABEL_COLUMNS}
+        for species_index, specie in enumerate(self.species):
+            for tray in specie.trays:
+                tray_index = len(self.tray_names)
+                self.tray_names.append(tray.name)
+                tray_species.append(species_index)
+                stats = specie.tray_stats(tray)
+                tray_columns["frames"].append(stats.frames)
+                tray_columns["plants"].append(stats.plants)
+                labels, columns = tray_label_rows(tray)
+                label_keys["species"].append(np.full(len(labels), species_index))
+                label_keys["tray"].append(np.full(len(labels), tray_index))
+                label_keys["label"].append(labels)
+                for column in LABEL_COLUMNS:
+                    label_columns[column].append(columns[column])
+
+        self.trays = {"species": np.array(tray_species, dtype=np.int64), "tray": np.arange(len(self.tray_names)),
+                      "trays": np.ones(len(self.tray_names), dtype=np.int64)}
+        self.trays.update({column: np.array(values, dtype=np.int64) for column, values in tray_columns.items()})
+        self.labels = {}
+        for name, values in list(label_keys.items()) + list(label_columns.items()):
+            dtype = np.float64 if name in FLOAT_COLUMNS else np.int64
+            self.labels[name] = np.concatenate([np.empty(0, dtype=dtype)] + values).astype(dtype)
+
+    @classmethod
+    def load(cls, directories: list, workers=None, cache=None, stream=False):
+        """Load the species directories (see pipeline.load_species) and aggregate them"""
+
+        return cls(load_species(directories, workers, cache, stream))
+
+    def _mask(self, table: dict, where: dict):
+        """Return the boolean mask of the rows of table that match where"""
+
+        mask = np.ones(len(table["species"]), dtype=bool)
+        for key, value in where.items():
+            if key not in table:  # e.g. label in the tray table
+                continue
+            if key == "species":
+                if value not in self.species_names:
+                    raise ValueError("unknown species: {}".format(value))
+                value = self.species_names.index(value)
+            elif key == "tray":
+                if value not in self.tray_names:
+                    raise ValueError("unknown tray: {}".format(value))
+                value = self.tray_names.index(value)
+            mask &= table[key] == value
+        return mask
+
+    def _group(self, table: dict, by: tuple, columns: tuple, where: dict):
+        """Return {group key tuple: {column: sum}} of the rows of table that match where"""
+
+        mask = self._mask(table, where)
+        keys = np.stack([table[key][mask] for key in by] + [np.zeros(int(mask.sum()), dtype=np.int64)], axis=1)
+        unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        sums = {column: np.bincount(inverse, weights=table[column][mask], minlength=len(unique))
+                for column in columns}
+        return {tuple(int(k) for k in unique[i, :-1]): {column: sums[column][i] for column in columns}
+                for i in range(len(unique))}
+
+    def query(self, by=("species",), where=None):
+        """Return the statistics grouped by some of the keys "species", "tray" and "label" as a list of rows
+
+        Parameters:
+            by: tuple of group keys, () for the totals of the whole dataset
+            where: dictionary {key: value} to keep only some species, trays or labels, e.g. {"label": 0}
+
+        Every row is a dictionary with the group keys (species and tray by name) and the sums of the LABEL_COLUMNS.
+        Without "label" in by, the rows also have the TRAY_COLUMNS: number of trays, frames and plants. Rows are
+        sorted by species (in the order of the dataset), tray and label. Raises ValueError for an unknown group key,
+        species or tray.
+        """
+
+        by = tuple(by)
+        where = where or {}
+        unknown = set(by) - set(GROUP_KEYS)
+        if unknown:
+            raise ValueError("unknown group keys: " + ", ".join(sorted(unknown)))
+        label_groups = self._group(self.labels, by, LABEL_COLUMNS, where)
+        if "label" in by:
+            tray_groups = {}
+        else:  # a label filter does not apply to the tray table
+            tray_groups = self._group(self.trays, by, TRAY_COLUMNS, where)
+        rows = []
+        keys = sorted(set(label_groups) | set(tray_groups))
+        if not by and not keys:
+            keys = [()]  # the totals of an empty dataset are zero
+        for key in keys:
+            row = dict(zip(by, self._names(by, key)))
+            sums = label_groups.get(key, {})
+            for column in LABEL_COLUMNS:
+                value = sums.get(column, 0)
+                row[column] = float(value) if column in FLOAT_COLUMNS else int(value)
+            if "label" not in by:
+                sums = tray_groups.get(key, {})
+                for column in TRAY_COLUMNS:
+                    row[column] = int(sums.get(column, 0))
+            rows.append(row)
+        return rows
+
+    def area_histogram(self, species=None):
+        """Return a histogram.Histogram of the bbox areas of all the species, or of one species given by name"""
+
+        histogram = area_histogram()
+        for specie in self.species:
+            if species is None or specie.name == species:
+                histogram.merge(specie.area_histogram())
+        return histogram
+
+    def _names(self, by: tuple, key: tuple):
+        """Replace the species and tray indices of a group key by their names"""
+
+        names = []
+        for name, value in zip(by, key):
+            if name == "species":
+                names.append(self.species_names[value])
+            elif name == "tray":
+                names.append(self.tray_names[value])
+            else:
+                names.append(value)
+        return names
+
+
+def as_dataset(species):
+    """Return species if it is a Dataset, otherwise aggregate the list of Specie instances in a new Dataset"""
+
+    return species if isinstance(species, Dataset) else Dataset(species)
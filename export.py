@@ -0,0 +1,233 @@
+"""
+Export of the annotations of the trays to the COCO and YOLO training formats.
+
+The categories are the species of the export (label_id 0 in a tray of that species) followed by "differentPlant"
+(label_id 1, a plant of another species). The bboxes of a tray are selected, converted and formatted with array
+operations, one tray at a time, and written in buffered chunks, so the memory does not grow with the corpus. With
+workers, the trays are exported in a pool of processes that each read one tray at a time (through the cache).
+
+Output, inside the output directory:
+    yolo/classes.txt: one category per line, the line number is the class id
+    yolo/labels/<frame id>.txt: one "class center_x center_y width height" line per bbox, normalized by the image size
+    coco/annotations.json: COCO object detection file, the file_name of an image is its frame id + image_extension
+
+The Datumaro files do not store the size of the images, so image_size is required for both formats.
+
+Run from the root of the repository:
+    python export.py --output export --image-size 4000 3000 --workers 4 --start 2021-07-01 ZEAMX SORXX ALOMY
+"""
+
+
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from pipeline import Tray, list_tray_files
+
+FORMATS = ("coco", "yolo")
+OTHER_CATEGORY = "differentPlant"
+IMAGE_ID_STRIDE = 1000000  # COCO image id = tray position * IMAGE_ID_STRIDE + frame position + 1
+ANNOTATION_ID_STRIDE = 100000000  # COCO annotation id = tray position * ANNOTATION_ID_STRIDE + bbox row + 1
+BUFFER_SIZE = 1 << 20
+COCO_IMAGE = '{{"id": {}, "file_name": {}, "width": {}, "height": {}, "frame": {}}}'
+COCO_ANNOTATION = ('{{"id": {}, "image_id": {}, "category_id": {}, "bbox": [{!r}, {!r}, {!r}, {!r}], "area": {!r}, '
+                   '"iscrowd": 0, "attributes": {{"track_id": {}}}}}')
+
+
+def category_names(species_names: list):
+    """Return the names of the categories, the position of a name is its YOLO class id (COCO category id - 1)"""
+
+    return list(species_names) + [OTHER_CATEGORY]
+
+
+def class_ids(label_ids, species_position: int, number_of_species: int):
+    """Return the class id of every bbox of a tray of the species at species_position in the export"""
+
+    return np.where(np.asarray(label_ids) == 0, species_position, number_of_species)
+
+
+def yolo_boxes(coordinates, image_size):
+    """Return an array (n, 4) with the normalized [center x, center y, width, height] of [x, y, w, h] bboxes, clipped
+    to the image"""
+
+    width, height = image_size
+    x0 = np.clip(coordinates[:, 0], 0, width)
+    y0 = np.clip(coordinates[:, 1], 0, height)
+    x1 = np.clip(coordinates[:, 0] + coordinates[:, 2], 0, width)
+    y1 = np.clip(coordinates[:, 1] + coordinates[:, 3], 0, height)
+    return np.stack([(x0 + x1) / (2 * width), (y0 + y1) / (2 * height), (x1 - x0) / width, (y1 - y0) / height], axis=1)
+
+
+def select(tray, labels=None, start=None, end=None):
+    """Return (frames, rows): the positions of the frames of a tray in the time window and the rows of their bboxes
+    with one of the labels
+
+    Parameters:
+        tray: a pipeline.Tray instance
+        labels: list of label_ids to export, None for all
+        start, end: time window of the frames, e.g. "2021-07-01" or numpy.datetime64, None for no limit. Frames
+            with a malformed time stamp are left out when a limit is given
+    """
+
+    keep_frame = np.ones(len(tray.plant_ids), dtype=bool)
+    if start is not None:
+        keep_frame &= tray.timestamps >= np.datetime64(start, "s")
+    if end is not None:
+        keep_frame &= tray.timestamps <= np.datetime64(end, "s")
+    keep_row = keep_frame[tray.frame_index]
+    if labels is not None:
+        keep_row &= np.isin(tray.label_ids, labels)
+    return np.flatnonzero(keep_frame), np.flatnonzero(keep_row)
+
+
+def _export_tray(tray, tray_position: int, species_position: int, options: dict):
+    """Worker of export: write the selected frames and bboxes of one tray, return (images, annotations)
+
+    tray is a pipeline.Tray or the name of its JSON file, read through options["cache"].
+    """
+
+    if isinstance(tray, str):
+        tray = Tray(tray, cache=options["cache"])
+    frames, rows = select(tray, options["labels"], options["start"], options["end"])
+    classes = class_ids(tray.label_ids[rows], species_position, options["number_of_species"])
+    frame_of_row = tray.frame_index[rows]
+    width, height = options["image_size"]
+    output = options["output"]
+
+    if "yolo" in options["formats"]:
+        boxes = yolo_boxes(tray.coordinates[rows], options["image_size"])
+        # rows are sorted by frame, so the bboxes of frame i are lines[starts[i]:starts[i + 1]]
+        lines = ["{} {:.6f} {:.6f} {:.6f} {:.6f}\n".format(c, *box) for c, box in zip(classes.tolist(), boxes.tolist())]
+        starts = np.searchsorted(frame_of_row, np.append(frames, len(tray.plant_ids)))
+        for i, frame in enumerate(frames):
+            file_name = os.path.join(output, "yolo", "labels", tray.plant_ids[frame] + ".txt")
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+            with open(file_name, "w") as f:
+                f.write("".join(lines[starts[i]:starts[i + 1]]))
+
+    if "coco" in options["formats"]:
+        image_ids = tray_position * IMAGE_ID_STRIDE + frames + 1
+        part = os.path.join(output, "coco", ".parts", "{:08d}".format(tray_position))
+        with open(part + ".images", "w", buffering=BUFFER_SIZE) as f:
+            f.write(",\n".join(COCO_IMAGE.format(image_id, json.dumps(tray.plant_ids[frame] + options["image_extension"]),
+                                                 width, height, frame_number)
+                               for image_id, frame, frame_number in zip(image_ids.tolist(), frames.tolist(),
+                                                                        tray.frame_numbers[frames].tolist())))
+        coordinates = tray.coordinates[rows]
+        with open(part + ".annotations", "w", buffering=BUFFER_SIZE) as f:
+            f.write(",\n".join(COCO_ANNOTATION.format(*values) for values in zip(
+                (tray_position * ANNOTATION_ID_STRIDE + rows + 1).tolist(),
+                (tray_position * IMAGE_ID_STRIDE + frame_of_row + 1).tolist(), (classes + 1).tolist(),
+                *coordinates.T.tolist(), (coordinates[:, 2] * coordinates[:, 3]).tolist(),
+                tray.track_ids[rows].tolist())))
+    return len(frames), len(rows)
+
+
+def _concatenate_parts(output: str, number_of_trays: int, categories: list):
+    """Write coco/annotations.json from the parts written by _export_tray, then remove the parts"""
+
+    parts = os.path.join(output, "coco", ".parts")
+    with open(os.path.join(output, "coco", "annotations.json"), "w", buffering=BUFFER_SIZE) as f:
+        f.write('{"info": {"description": "staticrops export"}, "licenses": [], "categories": ')
+        json.dump([{"id": i + 1, "name": name, "supercategory": ""} for i, name in enumerate(categories)], f)
+        for section in ("images", "annotations"):
+            f.write(', "{}": [\n'.format(section))
+            separator = ""
+            for tray_position in range(number_of_trays):
+                with open(os.path.join(parts, "{:08d}.{}".format(tray_position, section))) as part:
+                    first = part.read(1)
+                    if first:
+                        f.write(separator + first)
+                        shutil.copyfileobj(part, f, BUFFER_SIZE)
+                        separator = ",\n"
+            f.write("\n]")
+        f.write("}\n")
+    shutil.rmtree(parts)
+
+
+def export(species: list, output: str, image_size, formats=FORMATS, species_names=None, labels=None, start=None,
+           end=None, workers=None, cache=None, image_extension=".jpg"):
+    """Export the trays of many species to COCO and/or YOLO, return {"trays": .., "images": .., "annotations": ..}
+
+    Parameters:
+        species: list of pipeline.Specie instances, a dataset.Dataset, or a list of species directories
+        output: output directory
+        image_size: (width, height) of the images in pixels
+        formats: some of FORMATS
+        species_names: names of the species to export, None for all
+        labels: label_ids to export (0: correct plant, 1: different plant), None for all
+        start, end: time window of the frames, see select
+        workers: if greater than 1, export the trays in a pool of this many processes that read the JSON files again
+            (through cache) instead of sending the trays to the processes
+        cache: a cache.TrayCache used by the processes, and to read the trays of species directories
+        image_extension: added to the frame id to make the file_name of a COCO image
+    """
+
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError("unknown formats: " + ", ".join(sorted(unknown)))
+    if image_size is None or len(image_size) != 2 or min(image_size) <= 0:
+        raise ValueError("image_size must be (width, height), got {!r}".format(image_size))
+    species = getattr(species, "species", species)
+    directories = [specie if isinstance(specie, str) else specie.directory for specie in species]
+    keep = [i for i, directory in enumerate(directories)
+            if species_names is None or directory.split("/")[-1] in species_names]
+    names = [directories[i].split("/")[-1] for i in keep]
+    jobs = []  # (tray or file name, species position)
+    for position, i in enumerate(keep):
+        if isinstance(species[i], str):
+            jobs.extend((file_name, position) for file_name in list_tray_files(species[i]))
+        else:
+            jobs.extend((tray.file_name if workers and workers > 1 else tray, position) for tray in species[i].trays)
+
+    categories = category_names(names)
+    options = {"output": output, "formats": tuple(formats), "image_size": tuple(image_size), "labels": labels,
+               "start": start, "end": end, "number_of_species": len(names), "cache": cache,
+               "image_extension": image_extension}
+    if "yolo" in formats:
+        os.makedirs(os.path.join(output, "yolo", "labels"), exist_ok=True)
+        with open(os.path.join(output, "yolo", "classes.txt"), "w") as f:
+            f.write("".join(name + "\n" for name in categories))
+    if "coco" in formats:
+        os.makedirs(os.path.join(output, "coco", ".parts"), exist_ok=True)
+
+    arguments = ([tray for tray, _ in jobs], range(len(jobs)), [position for _, position in jobs],
+                 [options] * len(jobs))
+    if not workers or workers <= 1 or len(jobs) <= 1:
+        counts = list(map(_export_tray, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = list(executor.map(_export_tray, *arguments, chunksize=max(1, len(jobs) // (workers * 4))))
+    if "coco" in formats:
+        _concatenate_parts(output, len(jobs), categories)
+    return {"trays": len(jobs), "images": sum(images for images, _ in counts),
+            "annotations": sum(annotations for _, annotations in counts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the annotations of species directories to COCO and YOLO")
+    parser.add_argument("directories", nargs="+", help="species directories")
+    parser.add_argument("--output", required=True, help="output directory")
+    parser.add_argument("--image-size", type=int, nargs=2, required=True, metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--labels", type=int, nargs="+", default=None, help="label_ids to export, e.g. 0")
+    parser.add_argument("--start", default=None, help="first time of the frames, e.g. 2021-07-01")
+    parser.add_argument("--end", default=None, help="last time of the frames, e.g. 2021-08-01T12:00")
+    parser.add_argument("--image-extension", default=".jpg", help="extension of the COCO image file names")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes")
+    args = parser.parse_args()
+
+    from cache import default_cache
+
+    counts = export(args.directories, args.output, args.image_size, args.format, labels=args.labels,
+                    start=args.start, end=args.end, workers=args.workers, cache=default_cache(),
+                    image_extension=args.image_extension)
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
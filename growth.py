@@ -0,0 +1,204 @@
+"""
+Growth curves of the plants: the area, width and height of the bbox of every track against the time since germination.
+
+GrowthCurves stores the curves of many tracks as one ragged array, like the columns of a Tray: the observations of
+track i are hours[offsets[i]:offsets[i + 1]] (hours since the first observation of the track, from the time stamps of
+the frame ids) and area, width and height at the same positions. Growth rates, the time to reach an area and the mean
+curve on a common time grid are computed for all the tracks at once with np.add.reduceat and np.searchsorted.
+
+Usage:
+    curves = GrowthCurves.from_specie(Specie("ZEAMX"))
+    rates = curves.growth_rates()  # relative growth rate of the area of every track [1/h]
+    grid, mean, count = curves.mean_curve(step_hours=12)
+"""
+
+
+import numpy as np
+
+COLUMNS = ("area", "width", "height")
+
+
+class GrowthCurves:
+    def __init__(self, tray_names: list, trays, track_ids, hours, values: dict):
+        """Initializes the growth curves of many tracks
+
+        Parameters:
+            tray_names: names of the trays
+            trays: index in tray_names of the tray of every observation
+            track_ids: track_id of every observation
+            hours: time of every observation, hours since the first observation of its track
+            values: dictionary {column: array} with the COLUMNS (area, width and height) of every observation
+
+        The observations are sorted by tray, track and time, the observations with an unknown time (malformed frame
+        id) are left out.
+        """
+
+        trays = np.asarray(trays, dtype=np.int64)
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        hours = np.asarray(hours, dtype=np.float64)
+        known = ~np.isnan(hours)
+        order = np.lexsort((hours[known], track_ids[known], trays[known]))
+        self.tray_names = list(tray_names)
+        self.hours = hours[known][order]
+        self.values = {column: np.asarray(values[column], dtype=np.float64)[known][order] for column in COLUMNS}
+        trays, track_ids = trays[known][order], track_ids[known][order]
+        starts = np.flatnonzero(np.r_[True, (trays[1:] != trays[:-1]) | (track_ids[1:] != track_ids[:-1])]) \
+            if len(trays) else np.zeros(0, dtype=np.int64)
+        self.offsets = np.append(starts, len(trays))  # observations of track i: offsets[i]:offsets[i + 1]
+        self.trays = trays[starts]  # index in tray_names of the tray of every track
+        self.track_ids = track_ids[starts]  # track_id of every track
+        self.counts = np.diff(self.offsets)
+
+    @classmethod
+    def from_trays(cls, trays: list, discriminate=True):
+        """Return the growth curves of all the tracks of a list of pipeline.Tray instances
+
+        Parameters:
+            trays: list of Tray instances
+            discriminate: if True only the correct plants (label_id 0)
+        """
+
+        tray_index, track_ids, hours = [], [], []
+        values = {column: [] for column in COLUMNS}
+        for i, tray in enumerate(trays):
+            tracks = tray.tracks
+            keep = np.repeat(tracks.label_ids == 0 if discriminate else np.ones(len(tracks), dtype=bool),
+                             tracks.counts)
+            rows = tracks.rows[keep]
+            times = tray.timestamps[tray.frame_index[rows]]
+            first = np.repeat(tray.timestamps[tracks.first_frame], tracks.counts)[keep]
+            tray_index.append(np.full(len(rows), i))
+            track_ids.append(tray.track_ids[rows])
+            hours.append((times - first) / np.timedelta64(1, "h"))
+            width, height = tray.coordinates[rows, 2], tray.coordinates[rows, 3]
+            values["area"].append(width * height)
+            values["width"].append(width)
+            values["height"].append(height)
+
+        def concatenate(arrays):
+            return np.concatenate([np.empty(0)] + arrays)
+
+        return cls([tray.name for tray in trays], concatenate(tray_index), concatenate(track_ids), concatenate(hours),
+                   {column: concatenate(arrays) for column, arrays in values.items()})
+
+    @classmethod
+    def from_specie(cls, specie, discriminate=True):
+        """Return the growth curves of all the tracks of a pipeline.Specie, see from_trays"""
+
+        return cls.from_trays(specie.trays, discriminate)
+
+    def __len__(self):
+        """Return the number of tracks"""
+        return len(self.track_ids)
+
+    def curve(self, i: int, column="area"):
+        """Return (hours, values) of the observations of the track at position i"""
+
+        observations = slice(self.offsets[i], self.offsets[i + 1])
+        return self.hours[observations], self.values[column][observations]
+
+    def _sums(self, values):
+        """Return the sum of values over the observations of every track"""
+
+        if not len(self):
+            return np.zeros(0)
+        return np.add.reduceat(values, self.offsets[:-1])
+
+    def growth_rates(self, column="area", log=True):
+        """Return the least squares slope of every track, NaN for a track seen at a single time
+
+        Parameters:
+            column: one of COLUMNS
+            log: if True fit log(value) against hours, the slope is the relative growth rate [1/h], otherwise fit the
+                value, the slope is in pixels^2/h for the area or pixels/h for the width and height
+        """
+
+        y = self.values[column]
+        if log:
+            with np.errstate(divide="ignore"):
+                y = np.log(y)
+        x = self.hours
+        n = self.counts.astype(np.float64)
+        sum_x, sum_y = self._sums(x), self._sums(y)
+        denominator = n * self._sums(x * x) - sum_x * sum_x
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slopes = (n * self._sums(x * y) - sum_x * sum_y) / denominator
+        slopes[~(denominator > 1e-9 * n * n)] = np.nan
+        return slopes
+
+    def time_to_reach(self, threshold: float, column="area"):
+        """Return the hours since germination of the first observation of every track with a value >= threshold
+
+        NaN for the tracks that never reach the threshold.
+        """
+
+        if not len(self):
+            return np.zeros(0)
+        positions = np.where(self.values[column] >= threshold, np.arange(len(self.hours)), len(self.hours))
+        first = np.minimum.reduceat(positions, self.offsets[:-1])
+        reached = first < self.offsets[1:]
+        hours = np.full(len(self), np.nan)
+        hours[reached] = self.hours[first[reached]]
+        return hours
+
+    def resample(self, grid, column="area"):
+        """Return an array (tracks, len(grid)) with the values of every track linearly interpolated at the hours of
+        grid, NaN outside the observations of the track"""
+
+        grid = np.asarray(grid, dtype=np.float64)
+        if not len(self) or not len(grid):
+            return np.full((len(self), len(grid)), np.nan)
+        values = self.values[column]
+        # shift every track by its position so the hours of all the tracks are sorted in one array
+        span = max(float(self.hours.max()), float(grid.max()), 0.0) + 1.0
+        position = np.repeat(np.arange(len(self)), self.counts)
+        keys = self.hours + position * span
+        queries = grid[None, :] + (np.arange(len(self)) * span)[:, None]
+        right = np.searchsorted(keys, queries, side="left")  # first observation at or after the query
+        starts, stops = self.offsets[:-1, None], self.offsets[1:, None]
+        inside = (right < stops) & ((right > starts) | (self.hours[np.minimum(right, len(keys) - 1)] == grid[None, :]))
+        right = np.minimum(right, stops - 1)
+        left = np.maximum(right - 1, starts)
+        x0, x1 = self.hours[left], self.hours[right]
+        y0, y1 = values[left], values[right]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            resampled = np.where(x1 > x0, y0 + (y1 - y0) * (grid[None, :] - x0) / (x1 - x0), y1)
+        resampled[~inside] = np.nan
+        return resampled
+
+    def mean_curve(self, grid=None, step_hours=6.0, column="area"):
+        """Return (grid, mean, count): the mean of the resampled curves (see resample) and the number of tracks that
+        are observed at every time of the grid
+
+        Parameters:
+            grid: hours since germination, by default from 0 to the longest track every step_hours
+            step_hours: step of the default grid
+            column: one of COLUMNS
+        """
+
+        if grid is None:
+            longest = float(self.hours.max()) if len(self.hours) else 0.0
+            grid = np.arange(0.0, longest + step_hours, step_hours)
+        grid = np.asarray(grid, dtype=np.float64)
+        resampled = self.resample(grid, column)
+        count = np.count_nonzero(~np.isnan(resampled), axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.nansum(resampled, axis=0) / count
+        return grid, mean, count
+
+
+def mean_curves(species: list, step_hours=6.0, column="area", discriminate=True):
+    """Return {species name: (grid, mean, count)} of the mean growth curve of every species on a common grid
+
+    Parameters:
+        species: list of pipeline.Specie instances or a dataset.Dataset
+        step_hours: step of the grid, from 0 to the longest track of all the species
+        column: one of COLUMNS
+        discriminate: if True only the correct plants
+    """
+
+    species = getattr(species, "species", species)
+    curves = {specie.name: GrowthCurves.from_specie(specie, discriminate) for specie in species}
+    longest = max([float(c.hours.max()) for c in curves.values() if len(c.hours)] or [0.0])
+    grid = np.arange(0.0, longest + step_hours, step_hours)
+    return {name: c.mean_curve(grid, column=column) for name, c in curves.items()}
@@ -0,0 +1,162 @@
+"""
+Mergeable streaming histograms with fixed linear or logarithmic bins.
+
+A Histogram is filled with batches of values (add) and never keeps the values, only a count per bin, the number of
+values below and above the bins and the exact count, minimum and maximum. Histograms with the same bins merge exactly
+(the counts are integers), so the histograms of trays, species or worker processes can be combined in any order, and
+to_dict / from_dict serialize them compactly as JSON.
+
+Usage:
+    histogram = area_histogram()
+    for tray in specie.trays:
+        histogram.add(tray.bbox_areas())
+    median, p95 = histogram.quantile([0.5, 0.95])
+"""
+
+
+import numpy as np
+
+AREA_BINS = {"scale": "log", "low": 1.0, "high": 1e8, "bins": 80}  # bbox areas in pixels^2, 10 bins per decade
+LIFE_SPAN_BINS = {"scale": "linear", "low": 0.0, "high": 2160.0, "bins": 180}  # life spans in hours, 90 days
+
+
+class Histogram:
+    def __init__(self, scale="linear", low=0.0, high=1.0, bins=10):
+        """Initializes an empty histogram
+
+        Parameters:
+            scale: "linear" for bins of the same width, "log" for bins of the same width on a logarithmic axis
+            low, high: range of the bins, low must be > 0 if scale is "log"
+            bins: number of bins
+        """
+
+        if scale not in ("linear", "log"):
+            raise ValueError("scale must be 'linear' or 'log', not {!r}".format(scale))
+        if not low < high or bins < 1 or (scale == "log" and low <= 0):
+            raise ValueError("invalid bins: {} {} {} {}".format(scale, low, high, bins))
+        self.scale = scale
+        self.low = float(low)
+        self.high = float(high)
+        self.bins = int(bins)
+        if scale == "log":
+            self.edges = np.logspace(np.log10(self.low), np.log10(self.high), self.bins + 1)
+        else:
+            self.edges = np.linspace(self.low, self.high, self.bins + 1)
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        self.underflow = 0  # values < low
+        self.overflow = 0  # values > high
+        self.count = 0  # number of values, NaN excluded
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    def spec(self):
+        """Return the dictionary of the bins (the keyword arguments of __init__)"""
+
+        return {"scale": self.scale, "low": self.low, "high": self.high, "bins": self.bins}
+
+    def add(self, values):
+        """Add a batch of values, NaN values are ignored"""
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        # bin i holds edges[i] <= value < edges[i + 1], the last bin also holds high
+        bins = np.searchsorted(self.edges, values, side="right") - 1
+        bins[values == self.high] = self.bins - 1
+        inside = (bins >= 0) & (bins < self.bins)
+        self.counts += np.bincount(bins[inside], minlength=self.bins)
+        self.underflow += int(np.count_nonzero(values < self.low))
+        self.overflow += int(np.count_nonzero(values > self.high))
+        self.count += len(values)
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        return self
+
+    def merge(self, other):
+        """Add the counts of a histogram with the same bins to this histogram"""
+
+        if other.spec() != self.spec():
+            raise ValueError("cannot merge histograms with different bins: {} and {}".format(self.spec(), other.spec()))
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    def __add__(self, other):
+        """Return a new histogram with the counts of both histograms"""
+
+        return Histogram.from_dict(self.to_dict()).merge(other)
+
+    def __eq__(self, other):
+        return isinstance(other, Histogram) and self.to_dict() == other.to_dict()
+
+    def to_dict(self):
+        """Return a dictionary that can be written as JSON, see from_dict"""
+
+        return dict(self.spec(), counts=self.counts.tolist(), underflow=self.underflow, overflow=self.overflow,
+                    count=self.count, minimum=self.minimum if self.count else None,
+                    maximum=self.maximum if self.count else None)
+
+    @classmethod
+    def from_dict(cls, dictionary: dict):
+        """Return the Histogram of a dictionary returned by to_dict"""
+
+        histogram = cls(dictionary["scale"], dictionary["low"], dictionary["high"], dictionary["bins"])
+        histogram.counts = np.array(dictionary["counts"], dtype=np.int64)
+        histogram.underflow = dictionary["underflow"]
+        histogram.overflow = dictionary["overflow"]
+        histogram.count = dictionary["count"]
+        if dictionary["count"]:
+            histogram.minimum = dictionary["minimum"]
+            histogram.maximum = dictionary["maximum"]
+        return histogram
+
+    def quantile(self, q):
+        """Return the estimated q-quantile(s) of the values, q in [0, 1]
+
+        The values are assumed uniformly spread inside a bin (on a logarithmic axis for log bins), the underflow and
+        overflow are placed at the minimum and maximum, and the result is clipped to [minimum, maximum], so it is NaN
+        for an empty histogram.
+        """
+
+        scalar = np.ndim(q) == 0
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        if not self.count:
+            result = np.full(len(q), np.nan)
+            return float(result[0]) if scalar else result
+        # cumulative counts at the edges, the underflow is below the first edge
+        cumulative = self.underflow + np.concatenate([[0], np.cumsum(self.counts)])
+        rank = q * self.count
+        edges = np.log(self.edges) if self.scale == "log" else self.edges
+        position = np.interp(rank, cumulative, edges)
+        if self.scale == "log":
+            position = np.exp(position)
+        position[rank < self.underflow] = self.minimum
+        position[rank > cumulative[-1]] = self.maximum
+        result = np.clip(position, self.minimum, self.maximum)
+        return float(result[0]) if scalar else result
+
+    def trimmed(self):
+        """Return (counts, edges) without the empty bins at both ends"""
+
+        nonzero = np.flatnonzero(self.counts)
+        if not len(nonzero):
+            return self.counts[:0], self.edges[:1]
+        first, last = nonzero[0], nonzero[-1] + 1
+        return self.counts[first:last], self.edges[first:last + 1]
+
+
+def area_histogram():
+    """Return an empty Histogram with the bins of AREA_BINS"""
+
+    return Histogram(**AREA_BINS)
+
+
+def life_span_histogram():
+    """Return an empty Histogram with the bins of LIFE_SPAN_BINS"""
+
+    return Histogram(**LIFE_SPAN_BINS)
@@ -0,0 +1,237 @@
+"""
+Optional stage timers and counters for the loading, statistics and plotting pipeline.
+
+The instrumentation is disabled by default and then costs one function call per stage. Once enabled, every stage
+(e.g. json.load, index, aggregate, plot) records its number of calls, wall time and CPU time, and the counters
+record files, bytes read, frames, boxes and tracks. Stages and counters have a scope, the file name of a tray or the
+directory of a species, so the results can be broken down per tray and per species.
+
+Usage:
+    import instrument
+    recorder = instrument.enable()
+    ...  # load species, compute statistics, plot
+    print(recorder.summary())
+    recorder.to_json("instrumentation.json")
+
+Hooks run around a chosen stage, e.g. to profile only the parsing of the files:
+    profiler = cProfile.Profile()
+    recorder.add_hook("json.load", instrument.cprofile_hook(profiler))
+
+Stages that run in worker processes (Specie(workers=N), render.py) are not recorded.
+"""
+
+
+import contextlib
+import json
+import os
+import time
+from collections import defaultdict
+
+OFF_VALUES = ("", "0", "off", "false", "no")  # values of the environment switches that mean disabled, see cache.py
+
+
+class _NullStage:
+    """Context manager of the stages when the instrumentation is disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("recorder", "key", "hooks", "wall", "cpu")
+
+    def __init__(self, recorder, key: tuple):
+        self.recorder = recorder
+        self.key = key
+
+    def __enter__(self):
+        self.hooks = [hook(*self.key) for hook in self.recorder.hooks.get(self.key[0], ())]
+        for hook in self.hooks:
+            hook.__enter__()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        timer = self.recorder.stages[self.key]
+        timer[0] += 1
+        timer[1] += wall
+        timer[2] += cpu
+        for hook in reversed(self.hooks):
+            hook.__exit__(*exc_info)
+        return False
+
+
+class Instrumentation:
+    def __init__(self):
+        """Initializes an empty recorder of stage timers and counters"""
+
+        self.stages = defaultdict(lambda: [0, 0.0, 0.0])  # {(stage, scope): [calls, wall seconds, CPU seconds]}
+        self.counters = defaultdict(int)  # {(counter, scope): value}
+        self.hooks = {}  # {stage: [hook]}
+
+    def stage(self, name: str, scope=None):
+        """Return a context manager that times one run of a stage"""
+
+        return _Stage(self, (name, scope))
+
+    def count(self, name: str, value=1, scope=None):
+        """Add value to a counter"""
+
+        self.counters[(name, scope)] += value
+
+    def add_hook(self, stage: str, hook):
+        """Run hook around every run of a stage
+
+        Parameters:
+            stage: name of the stage
+            hook: function (stage, scope) -> context manager, e.g. cprofile_hook(profiler)
+        """
+
+        self.hooks.setdefault(stage, []).append(hook)
+
+    def to_dict(self):
+        """Return the stages and counters as a dictionary that can be written as JSON"""
+
+        return {
+            "stages": [{"stage": name, "scope": scope, "calls": calls, "wall": wall, "cpu": cpu}
+                       for (name, scope), (calls, wall, cpu) in self.stages.items()],
+            "counters": [{"counter": name, "scope": scope, "value": value}
+                         for (name, scope), value in self.counters.items()],
+        }
+
+    def to_json(self, file_name: str):
+        """Write to_dict to a JSON file"""
+
+        with open(file_name, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    def totals(self, by_species=False):
+        """Return ({stage: [calls, wall, cpu]}, {counter: value}) summed over the scopes
+
+        Parameters:
+            by_species: if True the keys are (stage or counter, species directory) instead, the species directory of
+                a tray is the directory of its file
+        """
+
+        def key(name, scope):
+            if not by_species:
+                return name
+            if scope is not None and scope.endswith(".json"):
+                scope = os.path.dirname(scope)
+            return name, scope
+
+        stages = defaultdict(lambda: [0, 0.0, 0.0])
+        for (name, scope), values in self.stages.items():
+            total = stages[key(name, scope)]
+            for i, value in enumerate(values):
+                total[i] += value
+        counters = defaultdict(int)
+        for (name, scope), value in self.counters.items():
+            counters[key(name, scope)] += value
+        return dict(stages), dict(counters)
+
+    def summary(self):
+        """Return a table with the time of every stage and the counters"""
+
+        stages, counters = self.totals()
+        total_wall = sum(wall for _, wall, _ in stages.values()) or 1.0
+        lines = ["{:<24}{:>8}{:>12}{:>12}{:>8}".format("stage", "calls", "wall [s]", "cpu [s]", "wall %")]
+        for name, (calls, wall, cpu) in sorted(stages.items(), key=lambda item: -item[1][1]):
+            lines.append("{:<24}{:>8}{:>12.4f}{:>12.4f}{:>8.1f}".format(name, calls, wall, cpu, 100 * wall / total_wall))
+        if counters:
+            lines.append("")
+            lines.append("{:<24}{:>16}".format("counter", "value"))
+            for name, value in sorted(counters.items()):
+                lines.append("{:<24}{:>16}".format(name, value))
+        return "\n".join(lines)
+
+
+_current = None
+
+
+def enable(recorder=None):
+    """Enable the instrumentation and return the recorder (a new Instrumentation by default)"""
+
+    global _current
+    _current = recorder if recorder is not None else Instrumentation()
+    return _current
+
+
+def disable():
+    """Disable the instrumentation and return the recorder that was used"""
+
+    global _current
+    recorder, _current = _current, None
+    return recorder
+
+
+def enabled():
+    """Return True if the instrumentation is enabled"""
+
+    return _current is not None
+
+
+def current():
+    """Return the current recorder, None if the instrumentation is disabled"""
+
+    return _current
+
+
+def stage(name: str, scope=None):
+    """Return a context manager that times one run of a stage, or a no-op if the instrumentation is disabled"""
+
+    if _current is None:
+        return _NULL_STAGE
+    return _current.stage(name, scope)
+
+
+def count(name: str, value=1, scope=None):
+    """Add value to a counter if the instrumentation is enabled"""
+
+    if _current is not None:
+        _current.count(name, value, scope)
+
+
+def cprofile_hook(profiler):
+    """Return a hook (see Instrumentation.add_hook) that enables a cProfile.Profile during the stage"""
+
+    @contextlib.contextmanager
+    def hook(stage_name, scope):
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+    return hook
+
+
+def enable_from_environment():
+    """Enable the instrumentation if the environment variable STATICROPS_INSTRUMENT is set, unless it is one of
+    OFF_VALUES (e.g. "0" or "off")
+
+    Returns the recorder or None. See report_to_environment.
+    """
+
+    if os.environ.get("STATICROPS_INSTRUMENT", "").lower() not in OFF_VALUES:
+        return enable()
+    return None
+
+
+def report_to_environment(recorder):
+    """Print the summary of recorder, and write it as JSON if STATICROPS_INSTRUMENT is the name of a .json file"""
+
+    if recorder is None:
+        return
+    print(recorder.summary())
+    file_name = os.environ.get("STATICROPS_INSTRUMENT", "")
+    if file_name.endswith(".json"):
+        recorder.to_json(file_name)
@@ -0,0 +1,244 @@
+"""
+Partial aggregates of the statistics of trays and species, to process a corpus on many machines (map-reduce).
+
+A worker computes the partial aggregates of a subset of the species directories and writes them as JSON (map). The
+partial aggregate of a tray holds its TrayStats (frames, samples, plants, correct and wrong plants, life span sums),
+the rows of dataset.tray_label_rows and the histograms of the bbox areas and of the life spans, so it does not need
+the JSON file of the tray anymore. The reducer merges the files of all the workers by species and tray (reduce): the
+merged SpeciePartial instances have the statistics API of pipeline.Specie used by dataset.Dataset and by the species
+plots, and the results are identical to a single-node run as long as the species are in the same order.
+
+Run from the root of the repository:
+    python partials.py map --output part-1.json ZEAMX SORXX ALOMY      # on the first machine
+    python partials.py map --output part-2.json AGRRE ECHCG POAAN      # on the second machine
+    python partials.py reduce --output merged.json part-1.json part-2.json
+    python cli.py stats --partials merged.json
+    python cli.py plot --partials merged.json --output report
+"""
+
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from dataset import FLOAT_COLUMNS, LABEL_COLUMNS, tray_label_rows
+from histogram import Histogram, area_histogram, life_span_histogram
+from pipeline import TrayStats
+
+PARTIAL_VERSION = 2  # 2: the life span columns of the label rows only count the correct plants
+
+
+class TrayPartial:
+    def __init__(self, file_name: str, stats: TrayStats, labels, columns: dict, area: Histogram, life_span: Histogram):
+        """Initializes the partial aggregate of a tray
+
+        Parameters:
+            file_name: name of the JSON file of the tray
+            stats: TrayStats of the tray
+            labels, columns: label rows of the tray, see dataset.tray_label_rows
+            area: histogram of the bbox areas
+            life_span: histogram of the life spans of the correct plants in hours
+        """
+
+        self.file_name = file_name
+        self.stats = stats
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.columns = columns
+        self.area = area
+        self.life_span = life_span
+
+    @property
+    def name(self):
+        """name of the file without directory and extension, e.g. ZEAMX_127827"""
+        return os.path.splitext(os.path.basename(self.file_name))[0]
+
+    @classmethod
+    def from_tray(cls, tray, stats=None):
+        """Return the partial aggregate of a pipeline.Tray (stats: its TrayStats if already known)"""
+
+        labels, columns = tray_label_rows(tray)
+        return cls(tray.file_name, stats or tray.stats(), labels, columns, tray.area_histogram(),
+                   life_span_histogram().add(tray.life_spans("h")))
+
+    def label_rows(self):
+        """Return (labels, {column: array}), see dataset.tray_label_rows"""
+
+        return self.labels, self.columns
+
+    def count_type_plant(self):
+        """Return [number of correct plants, number of different plants], see pipeline.Tray.count_type_plant"""
+
+        return [self.stats.correct_plants, self.stats.wrong_plants]
+
+    def count_samples(self):
+        return self.stats.samples
+
+    def number_plants(self):
+        return self.stats.plants
+
+    def to_dict(self):
+        """Return a dictionary that can be written as JSON, see from_dict"""
+
+        return {"file_name": self.file_name, "stats": self.stats.to_dict(), "labels": self.labels.tolist(),
+                "columns": {column: values.tolist() for column, values in self.columns.items()},
+                "area": self.area.to_dict(), "life_span": self.life_span.to_dict()}
+
+    @classmethod
+    def from_dict(cls, dictionary: dict):
+        """Return the TrayPartial of a dictionary returned by to_dict"""
+
+        columns = {column: np.array(dictionary["columns"][column],
+                                    dtype=np.float64 if column in FLOAT_COLUMNS else np.int64)
+                   for column in LABEL_COLUMNS}
+        return cls(dictionary["file_name"], TrayStats.from_dict(dictionary["stats"]), dictionary["labels"], columns,
+                   Histogram.from_dict(dictionary["area"]), Histogram.from_dict(dictionary["life_span"]))
+
+
+class SpeciePartial:
+    def __init__(self, directory: str, trays: list):
+        """Initializes the partial aggregate of the trays of a species
+
+        Parameters:
+            directory: directory of the species, its last component is the name of the species
+            trays: list of TrayPartial instances, they are sorted by file name like the trays of pipeline.Specie
+        """
+
+        self.directory = directory
+        self.trays = sorted(trays, key=lambda tray: os.path.basename(tray.file_name))
+
+    @property
+    def name(self):
+        """name of the directory of the specie, e.g. ZEAMX"""
+        return self.directory.split("/")[-1]
+
+    @classmethod
+    def from_specie(cls, specie):
+        """Return the partial aggregate of a pipeline.Specie"""
+
+        return cls(specie.directory, [TrayPartial.from_tray(tray, specie.tray_stats(tray)) for tray in specie.trays])
+
+    def merge(self, other):
+        """Add the trays of another partial aggregate of the same species, a tray cannot be in both"""
+
+        if other.name != self.name:
+            raise ValueError("cannot merge the species {} and {}".format(self.name, other.name))
+        names = {os.path.basename(tray.file_name) for tray in self.trays}
+        duplicates = sorted(names & {os.path.basename(tray.file_name) for tray in other.trays})
+        if duplicates:
+            raise ValueError("{}: trays in more than one partial aggregate: {}".format(self.name, ", ".join(duplicates)))
+        self.trays = sorted(self.trays + other.trays, key=lambda tray: os.path.basename(tray.file_name))
+        return self
+
+    def tray_stats(self, tray):
+        """Return the TrayStats of one of the trays of this species"""
+
+        return tray.stats
+
+    def totals(self):
+        """Return the sum of the TrayStats of all trays"""
+
+        totals = TrayStats()
+        for tray in self.trays:
+            totals += tray.stats
+        return totals
+
+    def total_number_plants(self):
+        return self.totals().plants
+
+    def count_type_plant(self):
+        """Return [number of correct plants, number of wrong plants] of this species"""
+
+        totals = self.totals()
+        return [totals.correct_plants, totals.wrong_plants]
+
+    def count_samples(self):
+        return self.totals().samples
+
+    def area_histogram(self):
+        """Return the merged histogram.Histogram of the bbox areas of all trays"""
+
+        histogram = area_histogram()
+        for tray in self.trays:
+            histogram.merge(tray.area)
+        return histogram
+
+    def life_span_histogram(self):
+        """Return the merged histogram.Histogram of the life spans in hours of the correct plants of all trays"""
+
+        histogram = life_span_histogram()
+        for tray in self.trays:
+            histogram.merge(tray.life_span)
+        return histogram
+
+    def to_dict(self):
+        return {"directory": self.directory, "trays": [tray.to_dict() for tray in self.trays]}
+
+    @classmethod
+    def from_dict(cls, dictionary: dict):
+        return cls(dictionary["directory"], [TrayPartial.from_dict(tray) for tray in dictionary["trays"]])
+
+
+def merge_partials(partials: list):
+    """Return the list of SpeciePartial with the trays of a list of SpeciePartial merged by species name
+
+    The species are in the order of their first appearance in partials.
+    """
+
+    merged = {}
+    for partial in partials:
+        if partial.name in merged:
+            merged[partial.name].merge(partial)
+        else:  # a copy, so the inputs are not modified
+            merged[partial.name] = SpeciePartial(partial.directory, list(partial.trays))
+    return list(merged.values())
+
+
+def write_partials(file_name: str, species: list):
+    """Write the partial aggregates of a list of pipeline.Specie or SpeciePartial instances to a JSON file"""
+
+    partials = [specie if isinstance(specie, SpeciePartial) else SpeciePartial.from_specie(specie)
+                for specie in getattr(species, "species", species)]
+    temporary = file_name + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump({"version": PARTIAL_VERSION, "species": [partial.to_dict() for partial in partials]}, f)
+    os.replace(temporary, file_name)
+
+
+def read_partials(file_names: list):
+    """Read and merge the partial aggregates of JSON files written by write_partials, see merge_partials"""
+
+    partials = []
+    for file_name in file_names:
+        with open(file_name) as f:
+            data = json.load(f)
+        if data.get("version") != PARTIAL_VERSION:
+            raise ValueError("{}: unsupported partial aggregate version {}".format(file_name, data.get("version")))
+        partials.extend(SpeciePartial.from_dict(species) for species in data["species"])
+    return merge_partials(partials)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write (map) or merge (reduce) partial aggregates of species")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    map_parser = subparsers.add_parser("map", help="write the partial aggregates of species directories")
+    map_parser.add_argument("directories", nargs="+", help="species directories")
+    map_parser.add_argument("--output", required=True, help="JSON file of the partial aggregates")
+    map_parser.add_argument("--workers", type=int, default=None, help="number of processes to parse the trays")
+    reduce_parser = subparsers.add_parser("reduce", help="merge partial aggregate files")
+    reduce_parser.add_argument("file_names", nargs="+", help="JSON files written by map")
+    reduce_parser.add_argument("--output", required=True, help="JSON file of the merged partial aggregates")
+    args = parser.parse_args()
+
+    if args.command == "map":
+        from cache import default_cache
+        from pipeline import load_species
+
+        write_partials(args.output, load_species(args.directories, args.workers, default_cache()))
+    else:
+        write_partials(args.output, read_partials(args.file_names))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,30 +5,75 @@ Provide classes for the Datumaro dataset created with CVAT (Computer Vision Anno
 The annotations are made in CVAT and saved as JSON files. This module implements functions to read these files.
 
 The classes are:
-    * Bbox: Bounding box of a crop
-    * Frame: Single image of a crop tray, containing 0 or many Bboxes
-    * Tray: Collection of many frames of a fixed tray over a period of time
+    * Bbox: Bounding box of a crop (a view over one row of the columns of a Tray)
+    * Frame: Single image of a crop tray, containing 0 or many Bboxes (a view over the rows of one frame)
+    * TrackIndex: Per-track lifecycle (first/last frame, label, observations) of the bboxes of a Tray
+    * TrayStats: Additive statistics (samples, plants, life spans, ...) of one or many trays
+    * Tray: Collection of many frames of a fixed tray over a period of time, stored as NumPy columns
     * Specie: Encapsulates all of the trays where a specie has been sembrada
 """
 
 
+import datetime
+import functools
+import inspect
 import json
 import os
+import re
+import warnings
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import instrument
+from histogram import area_histogram
+from spatial import GridIndex
+from streaming import iter_items
+
+STATE_VERSION = 2  # version of the files written by Specie.save_state
+
+
+class TrayParseError(Exception):
+    def __init__(self, errors: dict):
+        """Raised when one or more JSON files cannot be parsed
+
+        Parameters:
+            errors: dictionary {file name: description of the error}
+        """
+
+        self.errors = errors
+        super().__init__("could not parse " + ", ".join("{} ({})".format(name, error) for name, error in errors.items()))
 
 
 class Bbox:
-    def __init__(self, track_id: int, label_id: int, coordinates: list):
-        """Initializes a CVAT bounding box
+    __slots__ = ("tray", "index")
+
+    def __init__(self, tray, index: int):
+        """Initializes a CVAT bounding box as a view over one row of the columns of a Tray
 
         Parameters:
-            track_id: the ID of the Bbox, IDs are unique within a Tray and within a frame
-            label_id: it is set to 0 if the crop inside this Bbox matches the main specie in the tray (aka correct plant), otherwise it is set to 1 (different plant).
-            coordinates: [x-upper left corner, y-upper left corner, width, height]
+            tray: the Tray instance that stores the bbox
+            index: row of the bbox in the columns of the tray
         """
 
-        self.track_id = track_id + 1  # +1 so track_id in json file equals track_id in CVAT
-        self.coordinates = coordinates
-        self.label_id = label_id
+        self.tray = tray
+        self.index = index
+
+    @property
+    def track_id(self):
+        """the ID of the Bbox, IDs are unique within a Tray and within a frame"""
+        return int(self.tray.track_ids[self.index])
+
+    @property
+    def label_id(self):
+        """set to 0 if the crop inside this Bbox matches the main specie in the tray (aka correct plant), otherwise it is set to 1 (different plant)"""
+        return int(self.tray.label_ids[self.index])
+
+    @property
+    def coordinates(self):
+        """[x-upper left corner, y-upper left corner, width, height]"""
+        return self.tray.coordinates[self.index].tolist()
 
     def __str__(self):
         """Return an oneline str with the parameters of Bbox class"""
@@ -37,18 +82,34 @@ class Bbox:
 
 
 class Frame:  # Information about: plant id, frame number and bboxes (track_id, label_id, coordinates)
-    def __init__(self, plant_id: str, frame_number: int, bboxes: list):
-        """Initializes a CVAT Frame
+    __slots__ = ("tray", "index")
+
+    def __init__(self, tray, index: int):
+        """Initializes a CVAT Frame as a view over the bboxes of one frame of a Tray
 
         Parameters:
-            plant_id: id of the frame (image) with time stamp. e.g.: POAAN/113804/POAAN_113804_2021Y07M22D_13H26M19S_img
-            frame_number: number of the frame
-            bboxes: a list of instances of the Bbox class
+            tray: the Tray instance that stores the frame
+            index: position of the frame in the tray
         """
 
-        self.plant_id = plant_id
-        self.frame_number = frame_number
-        self.bboxes = bboxes
+        self.tray = tray
+        self.index = index
+
+    @property
+    def plant_id(self):
+        """id of the frame (image) with time stamp. e.g.: POAAN/113804/POAAN_113804_2021Y07M22D_13H26M19S_img"""
+        return self.tray.plant_ids[self.index]
+
+    @property
+    def frame_number(self):
+        """number of the frame"""
+        return int(self.tray.frame_numbers[self.index])
+
+    @property
+    def bboxes(self):
+        """a list of Bbox views of this frame"""
+        start, stop = self.tray.frame_offsets[self.index], self.tray.frame_offsets[self.index + 1]
+        return [Bbox(self.tray, i) for i in range(start, stop)]
 
     def __str__(self):
         """Return a str with the parameter of the Frame class"""
@@ -59,55 +120,435 @@ class Frame:  # Information about: plant id, frame number and bboxes (track_id,
 
     def count_samples(self):
         """This function counts the number of samples (number of annotated bboxes in each frame)"""
-        return len(self.bboxes)
+        return int(self.tray.frame_offsets[self.index + 1] - self.tray.frame_offsets[self.index])
+
+
+def columns_from_items(items):
+    """Convert the items of a Datumaro JSON file into the columns of a Tray
+
+    Parameters:
+        items: iterable of the item dictionaries of a Datumaro JSON file, e.g. the "items" list or streaming.iter_items
+
+    Returns a dictionary with the per-frame columns plant_ids and frame_numbers and the per-bbox columns
+    frame_index, track_ids, label_ids and coordinates ([x, y, width, height] per row)
+    """
+
+    plant_ids = []
+    frame_numbers = array("i")  # compact buffers, items can be consumed one at a time
+    frame_index = array("i")
+    track_ids = array("i")
+    label_ids = array("h")
+    coordinates = array("d")
+    for position, element in enumerate(items):
+        plant_ids.append(element["id"])
+        frame_numbers.append(int(element["attr"]["frame"]))
+        for annotation in element["annotations"]:
+            frame_index.append(position)
+            track_ids.append(int(annotation["attributes"]["track_id"]) + 1)  # +1 so track_id in json file equals track_id in CVAT
+            label_ids.append(int(annotation["label_id"]))  # correct plant = 0, different plant = 1
+            coordinates.extend(annotation["bbox"])
+    return {
+        "plant_ids": plant_ids,
+        "frame_numbers": np.array(frame_numbers, dtype=np.int32),
+        "frame_index": np.array(frame_index, dtype=np.int32),
+        "track_ids": np.array(track_ids, dtype=np.int32),
+        "label_ids": np.array(label_ids, dtype=np.int16),
+        "coordinates": np.array(coordinates, dtype=np.float64).reshape(-1, 4),
+    }
+
+
+def read_tray_columns(file_name: str, cache=None, stream=False):
+    """Parse a Datumaro JSON file and return its columns (see columns_from_items)
+
+    Parameters:
+        file_name: name of the file to be parsed
+        cache: a cache.TrayCache, the columns are read from it if the file did not change and stored in it otherwise
+        stream: if True decode the items one at a time (see streaming.iter_items) instead of loading the whole
+            file with json.load. Slower, but the peak memory is bounded by one item instead of the whole file.
+    """
+
+    try:
+        if cache is not None:
+            with instrument.stage("cache.load", file_name):
+                columns = cache.load(file_name)
+            if columns is not None:
+                instrument.count("cache hits", 1, file_name)
+                return columns
+            signature = cache.signature(file_name)
+        if instrument.enabled():
+            instrument.count("files", 1, file_name)
+            instrument.count("bytes read", os.path.getsize(file_name), file_name)
+        if stream:
+            with instrument.stage("json.stream", file_name):
+                columns = columns_from_items(iter_items(file_name))
+        else:
+            with instrument.stage("json.load", file_name):
+                with open(file_name) as f:
+                    data = json.load(f)  # Note: items is one of the main keys in this dictionary (categories, info, items)
+            with instrument.stage("columns", file_name):
+                columns = columns_from_items(data["items"])
+    except Exception as error:
+        raise TrayParseError({file_name: "{}: {}".format(type(error).__name__, error)}) from error
+    if cache is not None:
+        with instrument.stage("cache.store", file_name):
+            cache.store(file_name, columns, signature)
+    return columns
+
+
+def _read_tray_columns_or_error(file_name: str, cache=None, stream=False):
+    """Worker of load_trays: return (signature, columns, None) or (signature, None, error) so one corrupt file does not
+    stop the pool. The signature (see file_signature) is taken before parsing, so a concurrent change is seen as stale.
+    """
+
+    signature = file_signature(file_name)
+    try:
+        return signature, read_tray_columns(file_name, cache, stream), None
+    except TrayParseError as error:
+        return signature, None, error.errors[file_name]
+
+
+def list_tray_files(directory: str):
+    """Return the sorted names of the JSON files in directory"""
+
+    return [directory + "/" + element for element in sorted(os.listdir(directory)) if element.endswith(".json")]
+
+
+def scan_tray_files(directory: str):
+    """Return a dictionary {file name: (size, modification time)} of the JSON files in directory, sorted by name"""
+
+    signatures = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(".json") and entry.is_file():
+                stat = entry.stat()
+                signatures[directory + "/" + entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return dict(sorted(signatures.items()))
+
+
+def load_trays(file_names: list, workers=None, cache=None, stream=False):
+    """Create a Tray instance for every file, in the same order as file_names
+
+    Parameters:
+        file_names: names of the JSON files to be parsed
+        workers: if greater than 1, parse the files in a pool of this many processes. The processes send back the
+            columns of each tray (NumPy arrays), not Tray instances.
+        cache: a cache.TrayCache used to skip parsing the files that did not change, evicted once all files are loaded
+        stream: if True parse the files with bounded memory, see read_tray_columns
+
+    Raises TrayParseError naming every file that could not be parsed, after all the other files were parsed.
+    """
+
+    if not workers or workers <= 1 or len(file_names) <= 1:
+        results = [_read_tray_columns_or_error(file_name, cache, stream) for file_name in file_names]
+    else:
+        chunksize = max(1, len(file_names) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_read_tray_columns_or_error, file_names, [cache] * len(file_names),
+                                        [stream] * len(file_names), chunksize=chunksize))
+    if cache is not None:
+        cache.evict()
+    errors = {file_name: error for file_name, (_, _, error) in zip(file_names, results) if error is not None}
+    if errors:
+        raise TrayParseError(errors)
+    return [Tray(file_name, columns, cache, stream, signature=signature)
+            for file_name, (signature, columns, _) in zip(file_names, results)]
+
+
+def load_species(directories: list, workers=None, cache=None, stream=False):
+    """Create a Specie instance for every directory, parsing the trays of all of them in one pool of processes
+
+    Parameters:
+        directories: names of directories that contain JSON files of one specie each
+        workers: number of processes, see load_trays
+        cache: a cache.TrayCache, see load_trays
+        stream: if True parse the files with bounded memory, see read_tray_columns
+    """
+
+    file_names = [list_tray_files(directory) for directory in directories]
+    trays = load_trays([file_name for names in file_names for file_name in names], workers, cache, stream)
+    species = []
+    start = 0
+    for directory, names in zip(directories, file_names):
+        species.append(Specie(directory, trays=trays[start:start + len(names)]))
+        start += len(names)
+    return species
+
+
+class TrackIndex:
+    def __init__(self, track_ids, frame_index, label_ids):
+        """Index the bboxes of a Tray by track in a single pass over its columns
+
+        Parameters:
+            track_ids: track_id of every bbox
+            frame_index: position of the frame of every bbox, in increasing order
+            label_ids: label_id of every bbox
+
+        The attributes are arrays with one entry per track, sorted by track_id:
+            track_ids: the track_id of the track
+            first_frame: position of the frame where the track is first seen (germination)
+            last_frame: position of the frame where the track is last seen (death)
+            label_ids: label_id of the first bbox of the track
+            counts: number of bboxes (observations) of the track
+        """
+
+        self.rows = np.argsort(track_ids, kind="stable")  # rows of the bboxes grouped by track, in frame order
+        self.track_ids, starts, self.counts = np.unique(track_ids[self.rows], return_index=True, return_counts=True)
+        self.offsets = np.append(starts, len(self.rows))  # rows[offsets[i]:offsets[i + 1]] are the bboxes of track i
+        first_rows = self.rows[self.offsets[:-1]]
+        last_rows = self.rows[self.offsets[1:] - 1]
+        self.first_frame = frame_index[first_rows]
+        self.last_frame = frame_index[last_rows]
+        self.label_ids = label_ids[first_rows]
+        self.frame_index = frame_index
+
+    def __len__(self):
+        """Return the number of tracks"""
+        return len(self.track_ids)
+
+    def frames(self, track_id: int):
+        """Return an array with the positions of the frames where the track is seen"""
+
+        i = np.searchsorted(self.track_ids, track_id)
+        if i == len(self.track_ids) or self.track_ids[i] != track_id:
+            raise KeyError(track_id)
+        return self.frame_index[self.rows[self.offsets[i]:self.offsets[i + 1]]]
+
+
+class TrayStats:
+    FIELDS = ("frames", "samples", "plants", "correct_plants", "wrong_plants", "life_span_days_sum",
+              "life_span_hours_sum", "life_spans")
+
+    def __init__(self, **values):
+        """Initializes the additive statistics of one or many trays
+
+        Parameters (all 0 by default):
+            frames: number of frames
+            samples: number of annotated bboxes
+            plants: number of plants as counted by Tray.number_plants
+            correct_plants: number of tracks of the main specie of the tray (label_id 0)
+            wrong_plants: number of tracks of a different plant
+            life_span_days_sum: sum of the life spans in (truncated) days of the correct plants
+            life_span_hours_sum: sum of the life spans in hours of the correct plants
+            life_spans: number of life spans in the sums, tracks with a malformed frame id are left out
+        """
+
+        for field in self.FIELDS:
+            setattr(self, field, values.pop(field, 0))
+        if values:
+            raise TypeError("unknown fields: " + ", ".join(values))
+
+    @classmethod
+    def from_tray(cls, tray):
+        """Compute the statistics of a Tray"""
+
+        correct_plants, wrong_plants = tray.count_type_plant()
+        hours = tray.life_spans("h")
+        valid = ~np.isnan(hours)
+        return cls(frames=len(tray.frames), samples=tray.count_samples(), plants=tray.number_plants(),
+                   correct_plants=correct_plants, wrong_plants=wrong_plants,
+                   life_span_days_sum=int(tray.life_span_days()[valid].sum()),
+                   life_span_hours_sum=float(hours[valid].sum()), life_spans=int(valid.sum()))
+
+    def to_dict(self):
+        """Return the statistics as a dictionary"""
+
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, values: dict):
+        """Inverse of to_dict"""
+
+        return cls(**values)
+
+    def __add__(self, other):
+        return TrayStats(**{field: getattr(self, field) + getattr(other, field) for field in self.FIELDS})
+
+    def __sub__(self, other):
+        return TrayStats(**{field: getattr(self, field) - getattr(other, field) for field in self.FIELDS})
+
+    def __eq__(self, other):
+        return isinstance(other, TrayStats) and self.to_dict() == other.to_dict()
+
+    def __str__(self):
+        return "TrayStats({})".format(", ".join("{}={}".format(k, v) for k, v in self.to_dict().items()))
+
+
+def memoized(method):
+    """Decorator that caches the result of a method in self.memo, keyed by the name of the method and its arguments.
+
+    The arguments are bound to the signature of the method with their defaults, so positional and keyword calls
+    with the same values share one entry, e.g. life_spans(), life_spans("h") and life_spans(unit="h").
+    The owner of the method resets self.memo when its data changes.
+    """
+
+    signature = inspect.signature(method)
+    defaults = tuple(parameter.default for parameter in list(signature.parameters.values())[1:])
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if args or kwargs:
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            key = (method.__name__,) + tuple(bound.arguments.values())[1:]
+        else:
+            key = (method.__name__,) + defaults
+        try:
+            return self.memo[key]
+        except KeyError:
+            value = self.memo[key] = method(self, *args, **kwargs)
+            return value
+    return wrapper
+
+
+def parse_frame_timestamp(plant_id: str):
+    """Return the datetime of a frame id, e.g. POAAN/113804/POAAN_113804_2021Y07M22D_13H26M19S_img"""
+
+    parts = plant_id.split("/")[-1].split("_")
+    return datetime.datetime.strptime(parts[2] + parts[3], "%YY%mM%dD%HH%MM%SS")
+
+
+_timestamp_pattern = re.compile(r"_(\d{4})Y(\d{2})M(\d{2})D_(\d{2})H(\d{2})M(\d{2})S")
+
+
+def parse_frame_timestamps(plant_ids: list):
+    """Parse the time stamps of many frame ids at once
+
+    Returns (timestamps, errors): a datetime64[s] array aligned with plant_ids, NaT where an id is malformed, and the
+    list of the malformed ids
+    """
+
+    iso = []
+    errors = []
+    for plant_id in plant_ids:
+        match = _timestamp_pattern.search(plant_id)
+        if match is None:
+            iso.append("NaT")
+            errors.append(plant_id)
+        else:
+            iso.append("{}-{}-{}T{}:{}:{}".format(*match.groups()))
+    try:
+        return np.array(iso, dtype="datetime64[s]"), errors
+    except ValueError:  # an impossible date such as month 13, find it
+        timestamps = np.empty(len(iso), dtype="datetime64[s]")
+        for i, value in enumerate(iso):
+            try:
+                timestamps[i] = np.datetime64(value, "s")
+            except ValueError:
+                timestamps[i] = np.datetime64("NaT")
+                errors.append(plant_ids[i])
+        return timestamps, errors
+
+
+def summarize_life_spans(life_spans, percentiles=(10, 25, 50, 75, 90)):
+    """Return a dictionary with count, mean, std, min, max and the given percentiles of an array of life spans
+
+    NaN values (malformed frame ids) are left out.
+    """
+
+    life_spans = np.asarray(life_spans, dtype=np.float64)
+    life_spans = life_spans[~np.isnan(life_spans)]
+    summary = {"count": len(life_spans)}
+    if len(life_spans) == 0:
+        return summary
+    summary.update(mean=float(life_spans.mean()), std=float(life_spans.std()),
+                   min=float(life_spans.min()), max=float(life_spans.max()))
+    for percentile, value in zip(percentiles, np.percentile(life_spans, percentiles)):
+        summary["p{}".format(percentile)] = float(value)
+    return summary
+
+
+def file_signature(file_name: str):
+    """Return (size, modification time) of a file, or None if it does not exist"""
+
+    try:
+        stat = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+_TRAY_DATA_ATTRIBUTES = frozenset(["plant_ids", "frame_numbers", "frame_index", "track_ids", "label_ids", "coordinates",
+                                   "frame_offsets", "frames", "tracks", "track_id_2_plant_ids", "signature",
+                                   "timestamps", "timestamp_errors"])
 
 
 class Tray:
-    def __init__(self, file_name: str):
+    def __init__(self, file_name: str, columns=None, cache=None, stream=False, lazy=False, signature=None):
         """Initializes a CVAT Tray
 
+        The annotations are stored column-wise in NumPy arrays, one row per bbox (frame_index, track_ids, label_ids
+        and coordinates) and one row per frame (plant_ids and frame_numbers). Frame and Bbox instances are views
+        over these columns. The aggregates (count_samples, count_type_plant, ...) are memoized until the columns
+        change (see reload).
+
         Parameters:
             file_name: name of the file to be parsed
+            columns: columns already read from file_name (see read_tray_columns), the file is not parsed again
+            cache: a cache.TrayCache to read the columns from instead of parsing the file, if it did not change
+            stream: if True parse the file with bounded memory, see read_tray_columns
+            lazy: if True the file is parsed on the first access to the frames or columns of the tray
+            signature: signature of file_name (see file_signature) taken before columns were read. By default the
+                current signature of the file, which misses a change of the file after columns were read.
         """
 
         self.file_name = file_name
-        self.frames = []  # list of Frame instances
-        self.track_id_2_plant_ids = {}  # dictionary with track_id and corresponding germination/death of the plant
+        self.cache = cache
+        self.stream = stream
+        self.memo = {}  # results of the memoized aggregates
+        if columns is not None:
+            self.signature = file_signature(file_name) if signature is None else signature
+            self.set_columns(columns)
+        elif not lazy:
+            self.populate_frames()
+
+    @property
+    def name(self):
+        """name of the file without directory and extension, e.g. ZEAMX_127827"""
+        return os.path.splitext(os.path.basename(self.file_name))[0]
+
+    def __getattr__(self, name):
+        """Parse the file on the first access to the data of a lazy Tray"""
+
+        if name in _TRAY_DATA_ATTRIBUTES and "file_name" in self.__dict__:
+            self.populate_frames()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def is_loaded(self):
+        """Return True if the file has been parsed"""
+
+        return "plant_ids" in self.__dict__
+
+    def is_stale(self):
+        """Return True if the file changed since it was parsed"""
+
+        return self.is_loaded() and file_signature(self.file_name) != self.signature
+
+    def reload(self):
+        """Parse the file again and reset the memoized aggregates"""
+
         self.populate_frames()
-        self.__populate_track_id_2_plant_ids()
 
     def count_type_plant(self):
         """Count the number of different plants and correct plants
         returns a list with [number of correct plants, number of different plants]
         """
 
-        number_of_zeros = 0
-        number_of_ones = 0
-        visited_track_ids = []
-        for frame in self.frames:
-            for bbox in frame.bboxes:
-                if bbox.track_id in visited_track_ids:
-                    continue
-                visited_track_ids.append(bbox.track_id)
-
-                if bbox.label_id == 0 or bbox.label_id == "0":
-                    number_of_zeros += 1
-                else:
-                    number_of_ones += 1
-        return [number_of_zeros, number_of_ones]
+        return list(self._type_plant_counts())
 
+    @memoized
+    def _type_plant_counts(self):
+        number_of_zeros = int(np.count_nonzero(self.tracks.label_ids == 0))
+        number_of_ones = len(self.tracks) - number_of_zeros
+        return number_of_zeros, number_of_ones
 
+    @memoized
     def number_plants(self):
         """Count the number of plants present in this Tray"""
 
-        maximum = 0
-        for frame in self.frames:  # iterate in list self.frame (line 50)
-            for bbox in frame.bboxes:  # iterate in list bboxes where the track_id, label_id and coordinates of the bboxes are. NOTE: this method is working because an instance of the class Bbox has been created before (line 60)
-                if bbox.track_id > maximum:  # search for the max value.
-                    maximum = bbox.track_id
+        maximum = int(self.tracks.track_ids[-1]) if len(self.tracks) else 0  # track_ids of the index are sorted
         return maximum + 1  # track id begins at 0 therefore +1
 
-
     def __str__(self):
         """Return a str with the file name and all its frames"""
 
@@ -119,92 +560,278 @@ class Tray:
     def count_samples(self):
         """Count the number of samples (annotated bboxes) in this Tray"""
 
-        samples = 0
-        for frame in self.frames:
-            samples += frame.count_samples()
-        return samples
+        return len(self.track_ids)
+
+    @memoized
+    def bbox_areas(self):
+        """Return a read-only array with the area (width * height) of every bbox in this Tray"""
+
+        areas = self.coordinates[:, 2] * self.coordinates[:, 3]
+        areas.flags.writeable = False
+        return areas
+
+    @memoized
+    def area_histogram(self):
+        """Return a histogram.Histogram of the area of every bbox in this Tray, see histogram.AREA_BINS"""
+
+        return area_histogram().add(self.bbox_areas())
+
+    @memoized
+    def life_spans(self, unit="h", discriminate=True):
+        """Return a read-only float array with the life span (death - germination) of every track, sorted by track_id
+
+        Parameters:
+            unit: NumPy time unit of the life spans, e.g. "h" (hours), "D" (days), "m" (minutes)
+            discriminate: if True only the correct plants, in the order of self.track_id_2_plant_ids
+
+        The life span is NaN if a frame id of the track is malformed
+        """
+
+        tracks = self.tracks
+        keep = tracks.label_ids == 0 if discriminate else slice(None)
+        delta = self.timestamps[tracks.last_frame[keep]] - self.timestamps[tracks.first_frame[keep]]
+        life_spans = delta / np.timedelta64(1, unit)
+        life_spans.flags.writeable = False
+        return life_spans
+
+    def life_span_days(self):
+        """Return the life spans in whole days (truncated) of the tracks of self.track_id_2_plant_ids"""
+
+        return np.floor(self.life_spans("D"))
+
+    @memoized
+    def spatial_index(self, cell_size=None):
+        """Return a spatial.GridIndex of the bboxes of this Tray grouped by frame (the groups are the frame positions)
+
+        Parameters:
+            cell_size: side of the cells of the grid, see spatial.GridIndex
+        """
+
+        return GridIndex(self.coordinates, self.frame_index, cell_size)
+
+    @memoized
+    def stats(self):
+        """Return the TrayStats of this Tray"""
+
+        return TrayStats.from_tray(self)
 
     def populate_frames(self):
-        """Create the Frame instances and add them to self.frames"""
+        """Read the columns of the JSON file and create the Frame views in self.frames"""
 
-        try:
-            with open(self.file_name) as f:  # open file as f
-                data = json.load(f)  # json.load: load a json file and save it as a Dictionary in Data variable.
-        except Exception:  # Note: items is one of the main keys in this dictionary (categories, info, items)
-            print(self.file_name)
-            raise Exception
-        for element in data[
-            "items"]:  # Note: items contains a list with a lot of dictionaries. Iterate through its keys.
-            annotations = element[
-                "annotations"]  # "annotations": is a key inside items that contains another dictionary with the key "bbox":
-            bboxes_info = []  # create an empty list for the bboxes
-            for element2 in annotations:  # iterate through the variable annotations that contains the following keys: "attr":, "bbox":, and "group":
-                track_id_bbox = int(element2["attributes"][
-                                        "track_id"])  # track_id is a key inside the attr dictionary. Save the corresponding value (id of the bbox) as a int.
-                label_id = element2[
-                    "label_id"]  # saves the corresponding value (correct plant = 0, different plant = 1) of the label_id key
-                bbox = Bbox(track_id_bbox, label_id, element2[
-                    "bbox"])  # create an instance of a Bbox class with the attr. track id, label_id (correct plant = 0, different plant = 1) and values of the key bbox (coordinates)
-                bboxes_info.append(bbox)  # append instance bbox to the empty list bboxes
-
-            frame = Frame(element["id"], int(element["attr"]["frame"]),
-                          bboxes_info)  # create an instance of the Frame class with the plant id, frames number and bboxes list(track_id, label_id, coordinates)
-            self.frames.append(frame)  # append this instance to empty self.frame
-
-    def __populate_track_id_2_plant_ids(self,
-                                        discriminate=True):
-        """populate the dictionary self.track_id_2_plant_ids
+        self.signature = file_signature(self.file_name)  # before parsing, so a concurrent change is seen as stale
+        self.set_columns(read_tray_columns(self.file_name, self.cache, self.stream))
+
+    def set_columns(self, columns: dict):
+        """Store the columns returned by read_tray_columns and create the Frame views
 
         Parameters:
-            discriminate: if True populate the self.track_id_2_plant_ids dictionary only with the correct plants
+            columns: dictionary with the columns plant_ids, frame_numbers, frame_index, track_ids, label_ids and coordinates,
+                and optionally the timestamps of the frames (datetime64[s])
         """
 
-        track_id_list = []  # populate track_id_list with bbox track_ids
-        for frame in self.frames:
-            for bbox in frame.bboxes:
-                if bbox.track_id not in track_id_list:
-                    if discriminate:
-                        if bbox.label_id == 0:
-                            track_id_list.append(bbox.track_id)
-                    else:
-                        track_id_list.append(bbox.track_id)
-        death = {}  # dictionary with {bbox track_id:plant_id} where the bbox is last seen
-        for track_id in track_id_list:
-            for frame in self.frames:
-                for bbox in frame.bboxes:
-                    if bbox.track_id == track_id:
-                        death[track_id] = frame.plant_id
-        germination = {}  # dictionary with {bbox track_id:plant_id} where the bbox is first seen
-        for track_id in track_id_list:
-            stop = False
-            for frame in self.frames:
-                if stop:
-                    break
-                for bbox in frame.bboxes:
-                    if bbox.track_id == track_id:
-                        germination[track_id] = frame.plant_id
-                        stop = True
-                        break
-        for track_id in track_id_list:  # populating self.track_id_2_plant_ids dictionary with germination and death dates.
-            self.track_id_2_plant_ids[track_id] = (germination[track_id], death[track_id])
+        with instrument.stage("index", self.file_name):
+            self._index_columns(columns)
+        if instrument.enabled():
+            instrument.count("frames", len(self.plant_ids), self.file_name)
+            instrument.count("boxes", len(self.track_ids), self.file_name)
+            instrument.count("tracks", len(self.tracks), self.file_name)
+
+    def _index_columns(self, columns: dict):
+        """Store the columns and build the frame views, time stamps and TrackIndex (see set_columns)"""
+
+        self.plant_ids = columns["plant_ids"]
+        self.frame_numbers = columns["frame_numbers"]
+        self.frame_index = columns["frame_index"]
+        self.track_ids = columns["track_ids"]
+        self.label_ids = columns["label_ids"]
+        self.coordinates = columns["coordinates"]
+        # frame_offsets[i]:frame_offsets[i + 1] are the rows of the bboxes of frame i
+        self.frame_offsets = np.searchsorted(self.frame_index, np.arange(len(self.plant_ids) + 1))
+        self.frames = [Frame(self, i) for i in range(len(self.plant_ids))]
+        if "timestamps" in columns:  # already parsed, e.g. by a snapshot.Snapshot
+            self.timestamps = columns["timestamps"]
+            self.timestamp_errors = [self.plant_ids[i] for i in np.flatnonzero(np.isnat(self.timestamps))]
+        else:
+            self.timestamps, self.timestamp_errors = parse_frame_timestamps(self.plant_ids)  # datetime64[s] per frame
+        if self.timestamp_errors:
+            warnings.warn("{}: {} malformed frame id(s), e.g. {}".format(
+                self.file_name, len(self.timestamp_errors), self.timestamp_errors[0]))
+        self.tracks = TrackIndex(self.track_ids, self.frame_index, self.label_ids)
+        self.track_id_2_plant_ids = self.get_track_id_2_plant_ids()
+        self.memo = {}
+
+    def get_track_id_2_plant_ids(self, discriminate=True):
+        """Return a dictionary {track_id: (plant_id where the bbox is first seen, plant_id where it is last seen)}
+
+        Parameters:
+            discriminate: if True the dictionary only contains the correct plants
+        """
+
+        tracks = self.tracks
+        keep = tracks.label_ids == 0 if discriminate else np.ones(len(tracks), dtype=bool)
+        return {int(track_id): (self.plant_ids[first], self.plant_ids[last])
+                for track_id, first, last in zip(tracks.track_ids[keep], tracks.first_frame[keep], tracks.last_frame[keep])}
 
 
 class Specie:  # input: directory with all the files of the same species, output: all the information needed (plant id, frame#, bboxes list(track_id, label_id, coordinates) for all the files inside this dictionary
-    def __init__(self, directory: str):
+    def __init__(self, directory: str, workers=None, trays=None, cache=None, stream=False, lazy=False, state=None):
         """Initializes an abstract representation of a collection of Tray instances that belongs to a certain specie
 
+        The statistics of every tray (TrayStats) and the aggregates (count_samples, count_type_plant, ...) are
+        memoized. refresh updates them incrementally when JSON files are added, changed or removed.
+
         Parameters:
             directory: name of a directory that contains JSON files of one specie
+            workers: if greater than 1, parse the JSON files in a pool of this many processes
+            trays: Tray instances already loaded from directory, the directory is not read again
+            cache: a cache.TrayCache to read unchanged trays from instead of parsing them
+            stream: if True parse the JSON files with bounded memory, see read_tray_columns
+            lazy: if True the JSON files are only listed, each tray is parsed on first access (workers is ignored)
+            state: name of a JSON file written by save_state. The statistics of the trays that did not change since
+                then are read from it, with lazy=True these trays are not parsed at all.
         """
 
         self.directory = directory
-        self.trays = []  # list of Tray instances
-        for element in os.listdir(
-                directory):  # returns a list containing the names of the entries in the directory given. Iterate through this list
-            full_file_name = directory + "/" + element  # construct/obtain the complete path of the file
-            x = Tray(
-                full_file_name)  # Create an instance of the class Tray tanking the complete path of the file as an argument
-            self.trays.append(x)  # append this (x) to the empty list self.trays
+        self.cache = cache
+        self.stream = stream
+        self.state = state
+        self.memo = {}  # results of the memoized aggregates
+        self.stats = {}  # {file name: (signature of the file, TrayStats)} of the trays whose statistics are known
+        if trays is None:
+            if lazy:
+                trays = [Tray(file_name, cache=cache, stream=stream, lazy=True) for file_name in list_tray_files(directory)]
+            else:
+                trays = load_trays(list_tray_files(directory), workers, cache, stream)
+        self.trays = trays  # list of Tray instances, sorted by file name
+        if state is not None and os.path.exists(state):
+            self.load_state(state)
+
+    @property
+    def name(self):
+        """name of the directory of the specie, e.g. ZEAMX"""
+        return self.directory.split("/")[-1]
+
+    def tray_stats(self, tray):
+        """Return the TrayStats of one of the trays of this Specie"""
+
+        entry = self.stats.get(tray.file_name)
+        if entry is not None and tray.is_loaded() and entry[0] != tray.signature:  # e.g. after tray.reload()
+            entry = None
+            self.memo = {}
+        if entry is None:
+            stats = tray.stats()
+            entry = self.stats[tray.file_name] = (tray.signature, stats)
+        return entry[1]
+
+    @memoized
+    def totals(self):
+        """Return the sum of the TrayStats of all trays"""
+
+        with instrument.stage("aggregate", self.directory):
+            totals = TrayStats()
+            for tray in self.trays:
+                totals += self.tray_stats(tray)
+        return totals
+
+    def refresh(self):
+        """Scan the directory and update the statistics for the JSON files that were added, changed or removed
+
+        Only these files are parsed, and their statistics are folded into the memoized totals instead of summing
+        all trays again. All of them are parsed before anything is updated: a file that cannot be parsed (e.g. still
+        being written) is skipped with a warning and keeps its previous statistics, or stays out of the trays if it
+        is new, so the next refresh tries it again.
+
+        Returns a dictionary with the sorted lists of "added", "changed" and "removed" file names, and the "errors"
+        {file name: description of the error} of the skipped files
+        """
+
+        current = scan_tray_files(self.directory)
+        known = {tray.file_name: tray for tray in self.trays}
+        removed = [file_name for file_name in known if file_name not in current]
+        added = [file_name for file_name in current if file_name not in known]
+        changed = []
+        for file_name, tray in known.items():
+            if file_name not in current:
+                continue
+            if file_name in self.stats:  # the file the statistics were computed from, even if the tray was reloaded
+                signature = self.stats[file_name][0]
+            elif tray.is_loaded():
+                signature = tray.signature
+            else:
+                continue  # nothing is known about this tray yet
+            if signature != current[file_name]:
+                changed.append(file_name)
+
+        parsed, errors = {}, {}  # {file name: (signature before parsing, columns)}
+        for file_name in changed + added:
+            signature = file_signature(file_name)
+            try:
+                parsed[file_name] = (signature, read_tray_columns(file_name, self.cache, self.stream))
+            except TrayParseError as error:
+                errors.update(error.errors)
+        if errors:
+            warnings.warn("{}, their previous statistics are kept".format(TrayParseError(errors)))
+        changed = [file_name for file_name in changed if file_name in parsed]
+        added = [file_name for file_name in added if file_name in parsed]
+        if not (added or changed or removed):
+            return {"added": added, "changed": changed, "removed": removed, "errors": errors}
+
+        totals = self.memo.get(("totals",))
+        for file_name in removed + changed:
+            entry = self.stats.pop(file_name, None)
+            if entry is not None:
+                stats = entry[1]
+            elif known[file_name].is_loaded():
+                stats = known[file_name].stats()
+            else:  # cannot be subtracted without parsing the file, the totals are summed again when needed
+                totals = None
+                continue
+            if totals is not None:
+                totals = totals - stats
+        for file_name in changed:
+            signature, columns = parsed[file_name]
+            known[file_name].signature = signature
+            known[file_name].set_columns(columns)
+        for file_name in added:
+            signature, columns = parsed[file_name]
+            known[file_name] = Tray(file_name, columns, self.cache, self.stream, signature=signature)
+        self.trays = [known[file_name] for file_name in sorted(known) if file_name not in removed]
+        self.memo = {}
+        if totals is not None:
+            for file_name in changed + added:
+                totals = totals + self.tray_stats(known[file_name])
+            self.memo[("totals",)] = totals
+        return {"added": added, "changed": changed, "removed": removed, "errors": errors}
+
+    def save_state(self, file_name=None):
+        """Write the statistics of all trays to a JSON file, see the state parameter of __init__
+
+        Parameters:
+            file_name: name of the file, self.state by default
+        """
+
+        file_name = file_name or self.state
+        trays = {}
+        for tray in self.trays:
+            stats = self.tray_stats(tray)
+            trays[tray.file_name] = {"signature": list(self.stats[tray.file_name][0]), "stats": stats.to_dict()}
+        with open(file_name, "w") as f:
+            json.dump({"version": STATE_VERSION, "directory": self.directory, "trays": trays}, f)
+
+    def load_state(self, file_name: str):
+        """Read the statistics of the trays that did not change from a file written by save_state"""
+
+        with open(file_name) as f:
+            state = json.load(f)
+        if state.get("version") != STATE_VERSION:
+            return
+        current = scan_tray_files(self.directory)
+        for tray in self.trays:
+            entry = state["trays"].get(tray.file_name)
+            if entry is not None and tuple(entry["signature"]) == current.get(tray.file_name):
+                if not tray.is_loaded() or tray.signature == current[tray.file_name]:
+                    self.stats[tray.file_name] = (tuple(entry["signature"]), TrayStats.from_dict(entry["stats"]))
+        self.memo = {}
 
     def __str__(self):
         """Return a str with all the names of the JSON file inside self.trays"""
@@ -217,32 +844,32 @@ class Specie:  # input: directory with all the files of the same species, output
     def total_number_plants(self):
         """Count the number of plants in this Specie"""
 
-        summ = 0
-        for element in self.trays:
-            summ += element.number_plants()
-        return summ
+        return self.totals().plants
 
     def count_type_plant(self):
         """Count the number of different plants and correct plants in this Specie
         return a list with the number of [correct plants, wrong plants]"""
 
-        number_of_zeros = 0
-        number_of_ones = 0
-        for tray in self.trays:
-            zeros_and_ones = tray.count_type_plant()
-            zeros = zeros_and_ones[0]
-            ones = zeros_and_ones[1]
-            number_of_zeros += zeros
-            number_of_ones += ones
-        return [number_of_zeros, number_of_ones]
+        totals = self.totals()
+        return [totals.correct_plants, totals.wrong_plants]
 
     def count_samples(self):
         """Count the number of labeled bboxes in this Specie"""
 
-        samples = 0
-        for tray in self.trays:
-            samples += tray.count_samples()
-        return samples
+        return self.totals().samples
+
+    @memoized
+    def life_spans(self, unit="h", discriminate=True):
+        """Return a read-only array with the life spans of the tracks of all trays, see Tray.life_spans"""
+
+        life_spans = np.concatenate([np.empty(0)] + [tray.life_spans(unit, discriminate) for tray in self.trays])
+        life_spans.flags.writeable = False
+        return life_spans
+
+    def life_span_summary(self, unit="h", discriminate=True, percentiles=(10, 25, 50, 75, 90)):
+        """Return the distribution of the life spans of this Specie, see summarize_life_spans"""
+
+        return summarize_life_spans(self.life_spans(unit, discriminate), percentiles)
 
     def get_list_bboxes(self):
         """Return a generator of all the bboxes in this Specie instance"""
@@ -251,3 +878,20 @@ class Specie:  # input: directory with all the files of the same species, output
             for frame in tray.frames:
                 for bbox in frame.bboxes:
                     yield bbox
+
+    @memoized
+    def bbox_areas(self):
+        """Return a read-only array with the area (width * height) of every bbox in this Specie"""
+
+        areas = np.concatenate([np.empty(0)] + [tray.bbox_areas() for tray in self.trays])
+        areas.flags.writeable = False
+        return areas
+
+    @memoized
+    def area_histogram(self):
+        """Return a histogram.Histogram of the area of every bbox in this Specie, merged from the trays"""
+
+        histogram = area_histogram()
+        for tray in self.trays:
+            histogram.merge(tray.area_histogram())
+        return histogram
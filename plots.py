@@ -1,16 +1,17 @@
-import datetime
-
 import matplotlib.pyplot as plt
-from pipeline import Specie, Tray
-from csv_files.annotation_times import dictionary_annotations_time_per_species
+
+import instrument
+from cache import default_cache
+from dataset import Dataset, as_dataset
+from growth import mean_curves
+from histogram import Histogram
+from pipeline import Specie, Tray, parse_frame_timestamp
+from csv_files.annotation_times import annotation_minutes_per_species
 
 
 def calculate_total_number_of_wrong_plants_across_all_species(species: list[Specie]):  # species es del tipo lista que contiene elementos del tipo Species
-    """sum of all different plants across all species"""
-    sum_wrong_plants = 0
-    for specie in species:
-        sum_wrong_plants += specie.count_type_plant()[-1]
-    return sum_wrong_plants
+    """sum of all different plants across all species (a list of Specie or a Dataset)"""
+    return as_dataset(species).query(())[0]["wrong_plants"]
 
 
 def number_of_wrong_plants_per_tray(specie: Specie):
@@ -24,30 +25,61 @@ def number_of_wrong_plants_per_tray(specie: Specie):
     return list_wrong_plants
 
 
-def plot_average_number_of_wrong_plants_per_tray_per_species(species: list[Specie], show=True):  # plant different when: label_id of bbox = 1
+def draw(ax, figure: dict):
+    """Draw a figure description (see the figure_* functions) on a matplotlib Axes"""
+    if figure["kind"] == "bar":
+        ax.bar(figure["x"], figure["y"])
+    elif figure["kind"] == "line":  # one curve per entry of "lines"
+        for line in figure["lines"]:
+            ax.plot(line["x"], line["y"], label=line["label"])
+        ax.legend()
+        if figure.get("log_y"):
+            ax.set_yscale("log")
+    else:  # "hist": counts of a precomputed histogram
+        edges = figure["edges"]
+        ax.hist(edges[:-1], bins=edges, weights=figure["counts"], edgecolor="black")
+        if figure.get("log_x"):
+            ax.set_xscale("log")
+    ax.set_xlabel(figure["xlabel"])
+    ax.set_ylabel(figure["ylabel"])
+    if "title" in figure:
+        ax.set_title(figure["title"])
+    if "xticks_rotation" in figure:
+        ax.tick_params(axis="x", labelrotation=figure["xticks_rotation"])
+
+
+def show_or_save(figure: dict, show=True, file_name=None):
+    """Draw a figure description on a new pyplot figure, then show it or save it as file_name"""
+    with instrument.stage("plot", file_name):
+        fig, ax = plt.subplots()
+        draw(ax, figure)
+        if show:
+            plt.show()
+        else:
+            fig.savefig(file_name)
+        plt.close(fig)  # every plot gets its own figure, nothing is drawn over the previous one
+
+
+def figure_average_number_of_wrong_plants_per_tray_per_species(species: list[Specie]):
     """Bar plot, y = avg. number of different plants per tray, x = species"""
     x = []
     y = []
-    for specie in species:
-        nominator = specie.count_type_plant()[-1]
-        denominator = len(specie.trays)
-        name = specie.directory.split("/")[-1]
-        x.append(name)
-        y.append(nominator / denominator)
-    plt.bar(x, y)
-    plt.xlabel('Species')
-    plt.ylabel('avg. number of wrong plants per tray per species')
-    if show:
-        plt.show()
-    else:
-        plt.savefig("plot_average_number_of_wrong_plants_per_tray_per_species.png")
+    for row in as_dataset(species).query(("species",)):
+        x.append(row["species"])
+        y.append(row["wrong_plants"] / row["trays"])
+    return {"kind": "bar", "x": x, "y": y, "xlabel": "Species",
+            "ylabel": "avg. number of wrong plants per tray per species"}
+
+
+def plot_average_number_of_wrong_plants_per_tray_per_species(species: list[Specie], show=True, file_name=None):  # plant different when: label_id of bbox = 1
+    """Bar plot, y = avg. number of different plants per tray, x = species"""
+    figure = figure_average_number_of_wrong_plants_per_tray_per_species(species)
+    show_or_save(figure, show, file_name or "plot_average_number_of_wrong_plants_per_tray_per_species.png")
+
 
 def total_number_of_labelled_plants(species: list[Specie]):  # sample = 1 annotated bbox
-    """sum of all annotated bboxes across all species"""
-    total_number_of_plants = 0
-    for specie in species:
-        total_number_of_plants += specie.total_number_plants()
-    return total_number_of_plants
+    """sum of all annotated bboxes across all species (a list of Specie or a Dataset)"""
+    return as_dataset(species).query(())[0]["plants"]
 
 def calculate_avg_number_of_labelled_plants_per_tray(specie: Specie):
     """Calculate the number of labelled plants per tray"""
@@ -55,152 +87,144 @@ def calculate_avg_number_of_labelled_plants_per_tray(specie: Specie):
     denominator = len(specie.trays)
     return nominator/denominator
 
-def plot_avg_number_of_labelled_plants_per_species(species: list[Specie], show=True):  # plant = track_id bbox
+def figure_avg_number_of_labelled_plants_per_species(species: list[Specie]):
     """Bar plot, y = sum number of plants per species, x = species"""
     x = []
     y = []
-    for specie in species:
-        x_values = specie.directory.split("/")[-1]
-        x.append(x_values)
-        y_values = calculate_avg_number_of_labelled_plants_per_tray(specie)
-        y.append(y_values)
-    plt.bar(x, y)
-    plt.xlabel('Species')
-    plt.ylabel('avg. number of labelled plants per tray')
-    if show:
-        plt.show()
-    else:
-        plt.savefig("plot_avg_number_of_labelled_plants_per_species.png")
+    for row in as_dataset(species).query(("species",)):
+        x.append(row["species"])
+        y.append(row["plants"] / row["trays"])
+    return {"kind": "bar", "x": x, "y": y, "xlabel": "Species", "ylabel": "avg. number of labelled plants per tray"}
+
+
+def plot_avg_number_of_labelled_plants_per_species(species: list[Specie], show=True, file_name=None):  # plant = track_id bbox
+    """Bar plot, y = sum number of plants per species, x = species"""
+    figure = figure_avg_number_of_labelled_plants_per_species(species)
+    show_or_save(figure, show, file_name or "plot_avg_number_of_labelled_plants_per_species.png")
+
 
-def plot_avg_number_of_samples_per_tray_per_species(species: list[Specie], show=True):  # sample = 1 annotated bbox
+def figure_avg_number_of_samples_per_tray_per_species(species: list[Specie]):
     """Bar plot, y = number of samples per species, x = species"""
     x = []
     y = []
-    for specie in species:
-        x_values = specie.directory.split("/")[-1]
-        y_values = specie.count_samples()/len(specie.trays)
-        x.append(x_values)
-        y.append(y_values)
-    plt.bar(x, y)
-    plt.xlabel('Species')
-    plt.ylabel('avg. number of samples per tray')
-    if show:
-        plt.show()
-    else:
-        plt.savefig("plot_avg_number_of_samples_per_tray_per_species.png")
+    for row in as_dataset(species).query(("species",)):
+        x.append(row["species"])
+        y.append(row["samples"] / row["trays"])
+    return {"kind": "bar", "x": x, "y": y, "xlabel": "Species", "ylabel": "avg. number of samples per tray"}
+
+
+def plot_avg_number_of_samples_per_tray_per_species(species: list[Specie], show=True, file_name=None):  # sample = 1 annotated bbox
+    """Bar plot, y = number of samples per species, x = species"""
+    figure = figure_avg_number_of_samples_per_tray_per_species(species)
+    show_or_save(figure, show, file_name or "plot_avg_number_of_samples_per_tray_per_species.png")
 
 
-def plot_average_time_annotation_per_tray_per_species(file_name: str, show=True):
+def figure_average_time_annotation_per_tray_per_species(csv_file_name: str):
     """Bar plot, y = time [hr] used for the annotation, x = species"""
-    dictionary_with_annotation_times = dictionary_annotations_time_per_species(file_name)
-    x = dictionary_with_annotation_times.keys()
-    y = []
-    for element in x:
-        list_of_times = dictionary_with_annotation_times[element]
-        hrs = 0
-        mins = 0
-        for time in list_of_times:
-            h, m = time.split(":")
-            hrs += int(h)
-            mins += int(m)
-        while mins >= 60:
-            mins -=60
-            hrs += 1
-        avg_time = (hrs + (mins/60))/len(list_of_times)
-        y.append(avg_time)
-    plt.bar(x, y)
-    plt.xlabel('Species')
-    plt.ylabel('avg. annotation time per tray per species [hrs]')
-    if show:
-        plt.show()
-    else:
-        plt.savefig("plot_avegare_time_annotation_per_tray_per_species.png")
-
-def plot_bbox_area_distribution(specie: Specie, bins=20, show=True):
-    """Bar plot, y = area, x = spezies"""
-    area = []
-    for bbox in specie.get_list_bboxes():  # bbox:[x-upper left corner, y-upper left corner, width, height]
-        width = float(bbox.coordinates[2])
-        height = float(bbox.coordinates[3])
-        area.append(width*height)
-    plt.hist(area, bins=bins, edgecolor="black")
-    plt.title("distribution of the bbox area")
-    plt.xlabel("pixels^2")
-    #  TODO: x achse --> log scale
-    plt.ylabel("count")
-    plt.title("Distribution area of the bboxes in: " + specie.directory)
-    if show:
-        plt.show()
+    minutes_per_species = annotation_minutes_per_species(csv_file_name)
+    x = list(minutes_per_species.keys())
+    y = [sum(minutes) / len(minutes) / 60 for minutes in minutes_per_species.values()]
+    return {"kind": "bar", "x": x, "y": y, "xlabel": "Species",
+            "ylabel": "avg. annotation time per tray per species [hrs]"}
+
+
+def plot_average_time_annotation_per_tray_per_species(csv_file_name: str, show=True, file_name=None):
+    """Bar plot, y = time [hr] used for the annotation, x = species (csv_file_name: CSV file with the annotation times,
+    file_name: image file, like the other plots)"""
+    figure = figure_average_time_annotation_per_tray_per_species(csv_file_name)
+    show_or_save(figure, show, file_name or "plot_avegare_time_annotation_per_tray_per_species.png")
+
+
+def figure_bbox_area_distribution(specie: Specie, bins=None):
+    """Histogram, y = count, x = area of the bboxes [pixels^2]
+
+    bins: None for the log-spaced bins of histogram.AREA_BINS (log scale, merged from the histograms of the trays), a
+        number of linear bins between the smallest and the largest area, or a dictionary of the bins of a
+        histogram.Histogram, e.g. {"scale": "log", "low": 10, "high": 1e6, "bins": 50}
+    """
+    if bins is None:
+        histogram = specie.area_histogram()
     else:
-        plt.savefig("plot_bbox_area_distribution.png")
+        areas = specie.bbox_areas()  # bbox:[x-upper left corner, y-upper left corner, width, height]
+        if not isinstance(bins, dict):
+            low = float(areas.min()) if len(areas) else 0.0
+            high = float(areas.max()) if len(areas) else 1.0
+            bins = {"scale": "linear", "low": low, "high": high if high > low else low + 1.0, "bins": bins}
+        histogram = Histogram(**bins).add(areas)
+    counts, edges = histogram.trimmed()
+    return {"kind": "hist", "counts": counts.tolist(), "edges": edges.tolist(), "log_x": histogram.scale == "log",
+            "xlabel": "pixels^2", "ylabel": "count", "title": "Distribution area of the bboxes in: " + specie.directory}
+
+
+def plot_bbox_area_distribution(specie: Specie, bins=None, show=True, file_name=None):
+    """Histogram, y = count, x = area of the bboxes [pixels^2], see figure_bbox_area_distribution for the bins"""
+    figure = figure_bbox_area_distribution(specie, bins)
+    show_or_save(figure, show, file_name or "plot_bbox_area_distribution_{}.png".format(specie.name))
+
 
 def get_date(plant_id):
-    x = plant_id.split("/")[-1]
-    date = x.split("_")[2]
-    year = date[0:4]
-    month = date[5:7]
-    days = date[8:10]
-    time = x.split("_")[3]
-    hrs = time[0:2]
-    minutes = time[3:5]
-    seconds = time[6:8]
-    z = year + ":" + month + ":" + days + ":" + hrs + ":" + minutes + ":" + seconds
-    return datetime.datetime.strptime(z, '%Y:%m:%d:%H:%M:%S')
-
-
-def plot_life_span_file(tray: Tray, show=True):
-    """Bar plot, y = growth rate [cm^2], x = time [hr]"""
-    x = tray.track_id_2_plant_ids.keys()
-    y = []
-    for track_id in x:
-        germination, death = tray.track_id_2_plant_ids[track_id]
-        birth_date = get_date(germination)
-        death_date = get_date(death)
-        life_span = death_date - birth_date
-        y.append(life_span.days)
-    plt.bar(x, y)
-    plt.xlabel('Track id')
-    plt.ylabel('Life span')
-    if show:
-        plt.show()
-    else:
-        plt.savefig("plot_life_span_file.png")
+    return parse_frame_timestamp(plant_id)
+
+
+def figure_life_span_file(tray: Tray):
+    """Bar plot, y = life span [days], x = track id"""
+    return {"kind": "bar", "x": list(tray.track_id_2_plant_ids.keys()), "y": tray.life_span_days().tolist(),
+            "xlabel": "Track id", "ylabel": "Life span"}
 
 
-def plot_avg_life_span_specie(specie: Specie, show=True):
+def plot_life_span_file(tray: Tray, show=True, file_name=None):
+    """Bar plot, y = life span [days], x = track id"""
+    figure = figure_life_span_file(tray)
+    show_or_save(figure, show, file_name or "plot_life_span_file_{}.png".format(tray.name))
+
+
+def figure_avg_life_span_specie(specie: Specie):
+    """Bar plot, y = average life span [days], x = tray (NaN, no bar, for a tray without life spans, e.g. all its frame
+    ids are malformed)"""
     x = []
     y = []
     for tray in specie.trays:
-        x.append(tray.file_name.split("/")[1].strip(".json"))
-        a = []
-        for track_id in tray.track_id_2_plant_ids:
-            germination, death = tray.track_id_2_plant_ids[track_id]
-            birth_date = get_date(germination)
-            death_date = get_date(death)
-            life_span = death_date - birth_date
-            a.append(life_span.days)
-        y.append(sum(a)/len(a))
-    plt.bar(x, y)
-    plt.xlabel('Tray')
-    plt.xticks(rotation=45)
-    plt.ylabel('Life span [days]')
-    plt.title("Average life span")
-    if show:
-        plt.show()
-    else:
-        plt.savefig("avg_life_span_specie.png")
+        x.append(tray.name)
+        stats = specie.tray_stats(tray)
+        y.append(stats.life_span_days_sum/stats.life_spans if stats.life_spans else float("nan"))
+    return {"kind": "bar", "x": x, "y": y, "xlabel": "Tray", "ylabel": "Life span [days]",
+            "title": "Average life span", "xticks_rotation": 45}
+
+
+def plot_avg_life_span_specie(specie: Specie, show=True, file_name=None):
+    figure = figure_avg_life_span_specie(specie)
+    show_or_save(figure, show, file_name or "avg_life_span_specie_{}.png".format(specie.name))
+
+
+def figure_mean_growth_curves(species: list[Specie], step_hours=12.0):
+    """Line plot, y = mean bbox area of the correct plants [pixels^2], x = time since germination [days], one line per
+    species (a list of Specie or a Dataset)"""
+    lines = []
+    for name, (grid, mean, count) in mean_curves(species, step_hours).items():
+        observed = count > 0
+        lines.append({"x": (grid[observed] / 24).tolist(), "y": mean[observed].tolist(), "label": name})
+    return {"kind": "line", "lines": lines, "log_y": True, "xlabel": "Time since germination [days]",
+            "ylabel": "Mean bbox area [pixels^2]", "title": "Mean growth curves"}
+
+
+def plot_mean_growth_curves(species: list[Specie], step_hours=12.0, show=True, file_name=None):
+    """Line plot, y = mean bbox area of the correct plants [pixels^2], x = time since germination [days]"""
+    figure = figure_mean_growth_curves(species, step_hours)
+    show_or_save(figure, show, file_name or "plot_mean_growth_curves.png")
 
 
 def main():
-    zeamx = Specie("ZEAMX")
-    sorx = Specie("SORXX")
-    alomy = Specie("ALOMY")
-    agrre = Specie("AGRRE")
-    echcg = Specie("ECHCG")
-    poaan = Specie("POAAN")
-    list_species = [zeamx, sorx, alomy, agrre, echcg, poaan]
-
-    x = calculate_total_number_of_wrong_plants_across_all_species(list_species)
+    recorder = instrument.enable_from_environment()  # STATICROPS_INSTRUMENT=1 or =file.json
+    cache = default_cache()  # set STATICROPS_CACHE=off to always parse the JSON files
+    zeamx = Specie("ZEAMX", cache=cache)
+    sorx = Specie("SORXX", cache=cache)
+    alomy = Specie("ALOMY", cache=cache)
+    agrre = Specie("AGRRE", cache=cache)
+    echcg = Specie("ECHCG", cache=cache)
+    poaan = Specie("POAAN", cache=cache)
+    dataset = Dataset([zeamx, sorx, alomy, agrre, echcg, poaan])  # all the statistics of the species in one pass
+
+    x = calculate_total_number_of_wrong_plants_across_all_species(dataset)
     print("Total number of wrong plants across all species: " + str(x))
 
     x = number_of_wrong_plants_per_tray(zeamx)
@@ -216,7 +240,7 @@ def main():
     x = number_of_wrong_plants_per_tray(poaan)
     print("Number of wrong plants per tray in poaan: " + str(x))
 
-    x = total_number_of_labelled_plants(list_species)
+    x = total_number_of_labelled_plants(dataset)
     print("Total number of labelled plants across all species: " + str(x))
 
     x = calculate_avg_number_of_labelled_plants_per_tray(zeamx)
@@ -232,9 +256,9 @@ def main():
     x = calculate_avg_number_of_labelled_plants_per_tray(poaan)
     print("Average number of labelled plants per tray in Poann: " + str(round(x, 2)))
 
-    plot_average_number_of_wrong_plants_per_tray_per_species(list_species)
-    plot_avg_number_of_labelled_plants_per_species(list_species)
-    plot_avg_number_of_samples_per_tray_per_species(list_species)
+    plot_average_number_of_wrong_plants_per_tray_per_species(dataset)
+    plot_avg_number_of_labelled_plants_per_species(dataset)
+    plot_avg_number_of_samples_per_tray_per_species(dataset)
     plot_average_time_annotation_per_tray_per_species("csv_files/annotation_time.csv")
     plot_bbox_area_distribution(zeamx)
     plot_bbox_area_distribution(sorx)
@@ -248,6 +272,8 @@ def main():
     plot_avg_life_span_specie(agrre)
     plot_avg_life_span_specie(echcg)
     plot_avg_life_span_specie(poaan)
+    plot_mean_growth_curves(dataset)
+    instrument.report_to_environment(recorder)
 
 
 if __name__ == "__main__":
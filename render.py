@@ -0,0 +1,135 @@
+"""
+Headless batch rendering of the plots of plots.py, e.g. for nightly reports.
+
+Every figure is described by a small dictionary (see the figure_* functions of plots.py) that only contains the
+statistics it shows. render_figures draws each description on its own matplotlib Figure with the non-interactive Agg
+backend, in a pool of processes, and writes it to a unique path inside the output directory. The SHA-1 of every
+description is kept in a manifest next to the images, and a figure whose description did not change since the last
+render is skipped.
+
+Run from the root of the repository:
+    python render.py --output report --workers 4 ZEAMX SORXX ALOMY AGRRE ECHCG POAAN
+"""
+
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+MANIFEST_NAME = ".render_manifest.json"
+
+
+def figure_jobs(species: list, annotation_file=None, trays=True):
+    """Return a dictionary {relative output path: figure description} with all the plots of plots.main
+
+    Parameters:
+        species: list of pipeline.Specie instances or a dataset.Dataset
+        annotation_file: CSV file with the annotation times, see csv_files.annotation_times
+        trays: if True also add the plots that need the bboxes of the trays: the life span plot of every tray and the
+            mean growth curves; False for partial aggregates (see partials.py)
+    """
+
+    import plots
+    from dataset import as_dataset
+
+    dataset = as_dataset(species)
+    species = dataset.species
+    jobs = {
+        "plot_average_number_of_wrong_plants_per_tray_per_species.png":
+            plots.figure_average_number_of_wrong_plants_per_tray_per_species(dataset),
+        "plot_avg_number_of_labelled_plants_per_species.png":
+            plots.figure_avg_number_of_labelled_plants_per_species(dataset),
+        "plot_avg_number_of_samples_per_tray_per_species.png":
+            plots.figure_avg_number_of_samples_per_tray_per_species(dataset),
+    }
+    if trays:
+        jobs["plot_mean_growth_curves.png"] = plots.figure_mean_growth_curves(dataset)
+    if annotation_file is not None:
+        jobs["plot_average_time_annotation_per_tray_per_species.png"] = \
+            plots.figure_average_time_annotation_per_tray_per_species(annotation_file)
+    for specie in species:
+        jobs[specie.name + "/plot_bbox_area_distribution.png"] = plots.figure_bbox_area_distribution(specie)
+        jobs[specie.name + "/avg_life_span_specie.png"] = plots.figure_avg_life_span_specie(specie)
+        if trays:
+            for tray in specie.trays:
+                jobs[specie.name + "/plot_life_span_file_" + tray.name + ".png"] = plots.figure_life_span_file(tray)
+    return jobs
+
+
+def figure_hash(figure: dict):
+    """Return the SHA-1 hex digest of a figure description"""
+
+    return hashlib.sha1(json.dumps(figure, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _render_figure(figure: dict, file_name: str):
+    """Draw one figure description on its own Figure and save it (runs in the worker processes)"""
+
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+    from plots import draw
+
+    fig = Figure()
+    draw(fig.subplots(), figure)
+    fig.savefig(file_name)
+    return file_name
+
+
+def render_figures(jobs: dict, output: str, workers=None, force=False):
+    """Render the figures whose description changed since the last render
+
+    Parameters:
+        jobs: dictionary {relative output path: figure description}, see figure_jobs
+        output: output directory, it contains the images and the manifest
+        workers: number of processes, by default the number of CPUs
+        force: if True render all the figures
+
+    Returns a dictionary {relative output path: "rendered" or "skipped"}
+    """
+
+    manifest_name = os.path.join(output, MANIFEST_NAME)
+    try:
+        with open(manifest_name) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    hashes = {path: figure_hash(figure) for path, figure in jobs.items()}
+    todo = [path for path in jobs
+            if force or manifest.get(path) != hashes[path] or not os.path.exists(os.path.join(output, path))]
+    for path in todo:
+        os.makedirs(os.path.dirname(os.path.join(output, path)), exist_ok=True)
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for path, _ in zip(todo, executor.map(_render_figure, [jobs[path] for path in todo],
+                                                  [os.path.join(output, path) for path in todo])):
+                manifest[path] = hashes[path]
+    with open(manifest_name, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return {path: "rendered" if path in todo else "skipped" for path in jobs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the plots of the given species directories")
+    parser.add_argument("directories", nargs="+", help="species directories")
+    parser.add_argument("--output", default="report", help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes")
+    parser.add_argument("--annotation-times", default=None, help="CSV file with the annotation times")
+    parser.add_argument("--force", action="store_true", help="render also the figures that did not change")
+    args = parser.parse_args()
+
+    from cache import default_cache
+    from pipeline import load_species
+
+    os.makedirs(args.output, exist_ok=True)
+    species = load_species(args.directories, args.workers, default_cache())
+    status = render_figures(figure_jobs(species, args.annotation_times), args.output, args.workers, args.force)
+    rendered = sum(1 for value in status.values() if value == "rendered")
+    print("{} figures rendered, {} unchanged".format(rendered, len(status) - rendered))
+
+
+if __name__ == "__main__":
+    main()
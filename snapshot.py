@@ -0,0 +1,205 @@
+"""
+Compact snapshot of a whole multi-species annotation corpus in one binary file, reloaded with numpy.memmap.
+
+Layout of a snapshot file:
+    * the magic bytes MAGIC and the length of the header (little-endian uint64)
+    * the header, UTF-8 JSON: format version, species (name, directory and range of trays) and for every array its
+      dtype, shape and offset in the file
+    * the arrays, aligned to ALIGNMENT bytes: per tray the offsets of its frames and bboxes, per frame the frame
+      number and time stamp, per bbox the frame index, track_id, label_id and coordinates, and a string table with
+      the file names of the trays and the ids of the frames
+
+Snapshot maps the arrays with numpy.memmap instead of reading them, so opening a snapshot takes milliseconds and
+worker processes on the same node share the pages of the file. Snapshot.species builds Specie and Tray instances whose
+columns are views into the mapped file, so they expose the usual statistics API.
+
+Run from the root of the repository:
+    python snapshot.py export corpus.snapshot ZEAMX SORXX ALOMY AGRRE ECHCG POAAN
+    python snapshot.py info corpus.snapshot
+"""
+
+
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from dataset import Dataset
+from pipeline import Specie, Tray
+
+MAGIC = b"STCROPS\x00"
+SNAPSHOT_VERSION = 1
+ALIGNMENT = 64
+
+
+def _string_table(strings: list):
+    """Return (offsets, data) of a list of str, data is the concatenation of the UTF-8 encoded strings"""
+
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def write_snapshot(file_name: str, species):
+    """Write the trays of many species to a snapshot file
+
+    Parameters:
+        file_name: name of the snapshot file, it is replaced atomically
+        species: list of pipeline.Specie instances or a dataset.Dataset
+    """
+
+    if isinstance(species, Dataset):
+        species = species.species
+    trays = [tray for specie in species for tray in specie.trays]
+    species_header = []
+    start = 0
+    for specie in species:
+        species_header.append({"name": specie.name, "directory": specie.directory,
+                               "trays": [start, start + len(specie.trays)]})
+        start += len(specie.trays)
+
+    def concatenate(name, dtype, shape=()):
+        return np.concatenate([np.empty((0,) + shape, dtype=dtype)] +
+                              [np.asarray(getattr(tray, name), dtype=dtype) for tray in trays])
+
+    frame_offsets = np.zeros(len(trays) + 1, dtype=np.int64)
+    np.cumsum([len(tray.plant_ids) for tray in trays], out=frame_offsets[1:])
+    box_offsets = np.zeros(len(trays) + 1, dtype=np.int64)
+    np.cumsum([len(tray.track_ids) for tray in trays], out=box_offsets[1:])
+    string_offsets, string_data = _string_table([tray.file_name for tray in trays] +
+                                                [plant_id for tray in trays for plant_id in tray.plant_ids])
+    arrays = {
+        "tray_frame_offsets": frame_offsets,
+        "tray_box_offsets": box_offsets,
+        "frame_numbers": concatenate("frame_numbers", np.int32),
+        "timestamps": concatenate("timestamps", "datetime64[s]").view(np.int64),
+        "frame_index": concatenate("frame_index", np.int32),
+        "track_ids": concatenate("track_ids", np.int32),
+        "label_ids": concatenate("label_ids", np.int16),
+        "coordinates": concatenate("coordinates", np.float64, (4,)),
+        "string_offsets": string_offsets,
+        "string_data": string_data,
+    }
+
+    header = {"version": SNAPSHOT_VERSION, "species": species_header, "trays": len(trays), "arrays": {}}
+    offset = 0  # relative to the end of the header, made absolute below
+    for name, values in arrays.items():
+        header["arrays"][name] = {"dtype": values.dtype.str, "shape": list(values.shape), "offset": offset}
+        offset += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+    # the header is padded so the first array is aligned, its length does not depend on the offsets it contains
+    encoded = json.dumps(header).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(encoded) + 32 * len(arrays)) // ALIGNMENT) * ALIGNMENT
+    for description in header["arrays"].values():
+        description["offset"] += data_start
+    encoded = json.dumps(header).encode("utf-8")
+    encoded += b" " * (data_start - len(MAGIC) - 8 - len(encoded))
+
+    temporary = file_name + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+        for name, values in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(values).tobytes())
+        f.truncate(max(f.tell(), data_start))
+    os.replace(temporary, file_name)
+
+
+class Snapshot:
+    def __init__(self, file_name: str):
+        """Open a snapshot file written by write_snapshot, the arrays are mapped and not read
+
+        Parameters:
+            file_name: name of the snapshot file
+        """
+
+        self.file_name = file_name
+        with open(file_name, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("{} is not a snapshot file".format(file_name))
+            length, = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(length))
+        if self.header["version"] != SNAPSHOT_VERSION:
+            raise ValueError("{}: unsupported snapshot version {}".format(file_name, self.header["version"]))
+        self.arrays = {}
+        for name, description in self.header["arrays"].items():
+            shape = tuple(description["shape"])
+            if 0 in shape:  # memmap cannot map empty arrays
+                self.arrays[name] = np.empty(shape, dtype=description["dtype"])
+            else:
+                self.arrays[name] = np.memmap(file_name, dtype=description["dtype"], mode="r",
+                                              offset=description["offset"], shape=shape)
+
+    def string(self, index: int):
+        """Return a string of the string table"""
+
+        offsets = self.arrays["string_offsets"]
+        return self.arrays["string_data"][offsets[index]:offsets[index + 1]].tobytes().decode("utf-8")
+
+    def strings(self, start: int, stop: int):
+        """Return the strings start to stop - 1 of the string table"""
+
+        offsets = self.arrays["string_offsets"]
+        data = self.arrays["string_data"][offsets[start]:offsets[stop]].tobytes()
+        base = offsets[start]
+        return [data[offsets[i] - base:offsets[i + 1] - base].decode("utf-8") for i in range(start, stop)]
+
+    def tray_columns(self, index: int):
+        """Return the columns of a tray (see pipeline.read_tray_columns), views into the mapped file"""
+
+        a = self.arrays
+        frames = slice(a["tray_frame_offsets"][index], a["tray_frame_offsets"][index + 1])
+        boxes = slice(a["tray_box_offsets"][index], a["tray_box_offsets"][index + 1])
+        number_of_trays = self.header["trays"]
+        return {
+            "plant_ids": self.strings(number_of_trays + frames.start, number_of_trays + frames.stop),
+            "frame_numbers": a["frame_numbers"][frames],
+            "timestamps": a["timestamps"][frames].view("datetime64[s]"),
+            "frame_index": a["frame_index"][boxes],
+            "track_ids": a["track_ids"][boxes],
+            "label_ids": a["label_ids"][boxes],
+            "coordinates": a["coordinates"][boxes],
+        }
+
+    def tray(self, index: int):
+        """Return a Tray whose columns are views into the mapped file"""
+
+        return Tray(self.string(index), self.tray_columns(index))
+
+    def species(self):
+        """Return a Specie instance for every species of the snapshot"""
+
+        return [Specie(description["directory"], trays=[self.tray(i) for i in range(*description["trays"])])
+                for description in self.header["species"]]
+
+    def dataset(self):
+        """Return a dataset.Dataset of all the species of the snapshot"""
+
+        return Dataset(self.species())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write or inspect snapshot files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="write the species directories to a snapshot file")
+    export.add_argument("file_name")
+    export.add_argument("directories", nargs="+")
+    export.add_argument("--workers", type=int, default=None)
+    info = subparsers.add_parser("info", help="print the statistics of a snapshot file")
+    info.add_argument("file_name")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        from cache import default_cache
+        from pipeline import load_species
+
+        write_snapshot(args.file_name, load_species(args.directories, args.workers, default_cache()))
+    else:
+        for row in Snapshot(args.file_name).dataset().query(("species",)):
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
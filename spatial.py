@@ -0,0 +1,174 @@
+"""
+Uniform grid index over the bboxes of a tray for region, nearest neighbour and overlap queries.
+
+The bboxes [x, y, w, h] are grouped, usually by frame, and every bbox is registered in every cell of the grid that it
+covers. The entries are sorted by (group, cell) so the bboxes of a cell are a contiguous slice found by binary search,
+and a query only looks at the cells it touches instead of all the bboxes. With the default cell size (the median size
+of the bboxes) a bbox covers a few cells, so building the index is O(n log n) and the queries are close to linear in
+the size of their result.
+
+Queries return rows of the bboxes in the columns of the tray, e.g. tray.track_ids[rows] or tray.frame_index[rows]:
+    index = tray.spatial_index()
+    rows = index.region(0, 0, 500, 500)  # bboxes of all the frames that intersect the upper left corner of the tray
+    rows = index.nearest(1000, 800, k=3, group=12)  # the 3 bboxes of frame 12 whose center is the closest
+    pairs, iou = index.overlaps(min_iou=0.9)  # duplicate bboxes within the same frame
+"""
+
+
+import numpy as np
+
+
+def _concatenate_ranges(starts, stops):
+    """Return the concatenation of np.arange(start, stop) for all the pairs of starts and stops"""
+
+    lengths = stops - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    keep = lengths > 0
+    starts, lengths = starts[keep], lengths[keep]
+    # cumsum of steps of 1, with a jump at the beginning of every range
+    steps = np.ones(total, dtype=np.int64)
+    steps[0] = starts[0]
+    ends = np.cumsum(lengths)[:-1]
+    steps[ends] = starts[1:] - (starts[:-1] + lengths[:-1] - 1)
+    return np.cumsum(steps)
+
+
+def box_iou(a, b):
+    """Return the IoU of the bboxes a[i] and b[i], arrays of shape (n, 4) with [x, y, w, h] rows"""
+
+    overlap_width = np.clip(np.minimum(a[:, 0] + a[:, 2], b[:, 0] + b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    overlap_height = np.clip(np.minimum(a[:, 1] + a[:, 3], b[:, 1] + b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    intersection = overlap_width * overlap_height
+    union = a[:, 2] * a[:, 3] + b[:, 2] * b[:, 3] - intersection
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, intersection / union, 0.0)
+
+
+class GridIndex:
+    def __init__(self, coordinates, groups=None, cell_size=None):
+        """Build a grid index over bboxes
+
+        Parameters:
+            coordinates: array of shape (n, 4) with one [x, y, w, h] bbox per row
+            groups: non negative integer group of every bbox, e.g. the frame_index column of a Tray, None for a single
+                group; overlaps are only searched within a group
+            cell_size: side of the square cells, by default the median of the largest side of the bboxes
+        """
+
+        self.coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 4)
+        n = len(self.coordinates)
+        self.groups = np.zeros(n, dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+        self.number_of_groups = int(self.groups.max()) + 1 if n else 1
+        x, y, width, height = self.coordinates.T
+        if cell_size is None:
+            cell_size = float(np.median(np.maximum(width, height))) if n else 1.0
+        self.cell_size = max(cell_size, 1e-9)
+        self.origin = (float(x.min()), float(y.min())) if n else (0.0, 0.0)
+        first_x, last_x = self._raw_cells(x, 0), self._raw_cells(x + width, 0)
+        first_y, last_y = self._raw_cells(y, 1), self._raw_cells(y + height, 1)
+        self.shape = (int(last_y.max()) + 1 if n else 1, int(last_x.max()) + 1 if n else 1)  # cells along y and x
+
+        # one entry per (bbox, covered cell)
+        columns = last_x - first_x + 1
+        covered = columns * (last_y - first_y + 1)
+        boxes = np.repeat(np.arange(n), covered)
+        position = np.arange(len(boxes)) - np.repeat(np.cumsum(covered) - covered, covered)
+        cell_y = first_y[boxes] + position // columns[boxes]
+        cell_x = first_x[boxes] + position % columns[boxes]
+        keys = self._keys(self.groups[boxes], cell_y, cell_x)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]  # sorted (group, cell) key of every entry
+        self.boxes = boxes[order]  # row of the bbox of every entry
+
+    def __len__(self):
+        """Return the number of bboxes"""
+        return len(self.coordinates)
+
+    def _raw_cells(self, values, axis: int):
+        """Return the cell of coordinates along x (axis 0) or y (axis 1)"""
+
+        return np.floor((np.asarray(values, dtype=np.float64) - self.origin[axis]) / self.cell_size).astype(np.int64)
+
+    def _cells(self, values, axis: int):
+        """Return the cell of coordinates along x (axis 0) or y (axis 1), clipped to the grid"""
+
+        return np.clip(self._raw_cells(values, axis), 0, self.shape[1 - axis] - 1)
+
+    def _keys(self, groups, cell_y, cell_x):
+        return (groups * self.shape[0] + cell_y) * self.shape[1] + cell_x
+
+    def _candidates(self, first_y, last_y, first_x, last_x, group=None):
+        """Return the unique rows of the bboxes registered in a rectangle of cells, in one or all groups"""
+
+        cell_y, cell_x = np.meshgrid(np.arange(first_y, last_y + 1), np.arange(first_x, last_x + 1), indexing="ij")
+        groups = np.arange(self.number_of_groups) if group is None else np.array([group])
+        keys = self._keys(groups[:, None], cell_y.ravel()[None, :], cell_x.ravel()[None, :]).ravel()
+        starts = np.searchsorted(self.keys, keys, side="left")
+        stops = np.searchsorted(self.keys, keys, side="right")
+        return np.unique(self.boxes[_concatenate_ranges(starts, stops)])
+
+    def region(self, x0: float, y0: float, x1: float, y1: float, group=None):
+        """Return the sorted rows of the bboxes that intersect the rectangle x0 <= x <= x1, y0 <= y <= y1
+
+        Parameters:
+            x0, y0, x1, y1: corners of the region
+            group: only search this group (e.g. the position of a frame), None for all the groups
+        """
+
+        if not len(self) or x1 < x0 or y1 < y0:
+            return np.zeros(0, dtype=np.int64)
+        rows = self._candidates(self._cells(y0, 1), self._cells(y1, 1), self._cells(x0, 0), self._cells(x1, 0), group)
+        x, y, width, height = self.coordinates[rows].T
+        return rows[(x <= x1) & (x + width >= x0) & (y <= y1) & (y + height >= y0)]
+
+    def nearest(self, x: float, y: float, k=1, group=None):
+        """Return the rows of the k bboxes whose center is the closest to the point (x, y), the closest first
+
+        Parameters:
+            x, y: the point
+            k: number of bboxes
+            group: only search this group, None for all the groups
+        """
+
+        if not len(self):
+            return np.zeros(0, dtype=np.int64)
+        cell_x, cell_y = int(self._cells(x, 0)), int(self._cells(y, 1))
+        # the cell of the center of a bbox is one of its cells, so the square of cells of radius r around the point
+        # contains every bbox whose center is closer than r * cell_size
+        radius = 0
+        while True:
+            rows = self._candidates(max(cell_y - radius, 0), min(cell_y + radius, self.shape[0] - 1),
+                                    max(cell_x - radius, 0), min(cell_x + radius, self.shape[1] - 1), group)
+            centers = self.coordinates[rows, :2] + self.coordinates[rows, 2:] / 2
+            distances = np.hypot(centers[:, 0] - x, centers[:, 1] - y)
+            order = np.argsort(distances, kind="stable")[:k]
+            covers_grid = radius >= max(cell_x, cell_y, self.shape[1] - 1 - cell_x, self.shape[0] - 1 - cell_y)
+            if covers_grid or (len(order) == k and distances[order[-1]] <= radius * self.cell_size):
+                return rows[order]
+            radius = max(1, 2 * radius)
+
+    def overlaps(self, min_iou=0.5):
+        """Return (pairs, iou): the rows (i, j), i < j, of the bboxes of the same group with an IoU >= min_iou
+
+        Parameters:
+            min_iou: IoU threshold, must be > 0
+        """
+
+        # candidate pairs are the entries of the same (group, cell), found by comparing every entry with the
+        # following ones until the end of the longest cell
+        starts = np.flatnonzero(np.r_[True, self.keys[1:] != self.keys[:-1]]) if len(self.keys) else np.zeros(0, int)
+        longest = int(np.diff(np.r_[starts, len(self.keys)]).max()) if len(starts) else 0
+        first, second = [], []
+        for shift in range(1, longest):
+            same = np.flatnonzero(self.keys[:-shift] == self.keys[shift:])
+            first.append(self.boxes[same])
+            second.append(self.boxes[same + shift])
+        if not first:
+            return np.zeros((0, 2), dtype=np.int64), np.zeros(0)
+        first, second = np.concatenate(first), np.concatenate(second)
+        pairs = np.unique(np.stack([np.minimum(first, second), np.maximum(first, second)], axis=1), axis=0)
+        iou = box_iou(self.coordinates[pairs[:, 0]], self.coordinates[pairs[:, 1]])
+        keep = iou >= min_iou
+        return pairs[keep], iou[keep]
@@ -0,0 +1,132 @@
+"""
+Streaming reader for very large Datumaro JSON files.
+
+json.load builds the dictionary tree of the whole file before a single frame can be used, so the peak memory is
+several times the size of the file. The functions of this module walk the top-level object incrementally and decode
+one element of the "items" array at a time, so the memory is bounded by the largest item instead of the file:
+    * iter_items: generator of the item dictionaries of a file
+    * iter_frames: generator of FrameRecord tuples (plant_id, frame_number and the bbox columns of one frame)
+"""
+
+
+import json
+import re
+from collections import namedtuple
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+FrameRecord = namedtuple("FrameRecord", ["plant_id", "frame_number", "track_ids", "label_ids", "coordinates"])
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+
+
+class _Buffer:
+    def __init__(self, f, chunk_size: int):
+        """Sliding window over a text file that only keeps the part that has not been decoded yet"""
+
+        self.f = f
+        self.chunk_size = chunk_size
+        self.text = ""
+        self.position = 0
+        self.eof = False
+
+    def fill(self):
+        """Read the next chunk, return False at the end of the file"""
+
+        if self.eof:
+            return False
+        # read at least as much as is pending, so decoding a large value is not quadratic
+        chunk = self.f.read(max(self.chunk_size, len(self.text) - self.position))
+        if not chunk:
+            self.eof = True
+            return False
+        self.text = self.text[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character"""
+
+        while True:
+            self.position = _whitespace.match(self.text, self.position).end()
+            if self.position < len(self.text):
+                return self.text[self.position]
+            if not self.fill():
+                raise ValueError("unexpected end of file")
+
+    def expect(self, characters: str):
+        """Consume the next character, which must be one of characters, and return it"""
+
+        character = self.peek()
+        if character not in characters:
+            raise ValueError("expected {!r} but found {!r} at offset {}".format(characters, character, self.position))
+        self.position += 1
+        return character
+
+    def decode(self):
+        """Decode the next JSON value"""
+
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.text, self.position)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            if end == len(self.text) and self.fill():  # a number may continue in the next chunk
+                continue
+            self.position = end
+            return value
+
+
+def iter_items(file_name: str, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the item dictionaries of a Datumaro JSON file one at a time
+
+    Parameters:
+        file_name: name of the file to be parsed
+        chunk_size: number of characters read at once
+    """
+
+    with open(file_name) as f:
+        buffer = _Buffer(f, chunk_size)
+        buffer.expect("{")
+        if buffer.peek() == "}":
+            return
+        while True:
+            key = buffer.decode()
+            buffer.expect(":")
+            if key == "items":
+                buffer.expect("[")
+                if buffer.peek() == "]":
+                    buffer.position += 1
+                else:
+                    while True:
+                        yield buffer.decode()
+                        if buffer.expect(",]") == "]":
+                            break
+            else:
+                buffer.decode()  # info, categories: small and not needed
+            if buffer.expect(",}") == "}":
+                return
+
+
+def iter_frames(file_name: str, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield a FrameRecord for every item of a Datumaro JSON file, without materializing the tray
+
+    The track_ids (+1, as in CVAT), label_ids and coordinates ([x, y, width, height] per row) of a FrameRecord are
+    NumPy arrays with one row per bbox of the frame.
+    """
+
+    for element in iter_items(file_name, chunk_size):
+        annotations = element["annotations"]
+        yield FrameRecord(
+            element["id"],
+            int(element["attr"]["frame"]),
+            np.array([int(a["attributes"]["track_id"]) + 1 for a in annotations], dtype=np.int32),
+            np.array([int(a["label_id"]) for a in annotations], dtype=np.int16),
+            np.array([a["bbox"] for a in annotations], dtype=np.float64).reshape(-1, 4),
+        )
@@ -0,0 +1,37 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def tray_items(name: str, tracks: dict, frames=3, day=1):
+    """Return the Datumaro items of a tray with one frame per 12 hours
+
+    Parameters:
+        name: name of the tray, e.g. ZEAMX_000001
+        tracks: dictionary {track_id: label_id}, every track has a bbox in every frame
+        frames: number of frames
+        day: day of July 2021 of the first frame
+    """
+
+    items = []
+    for frame in range(frames):
+        plant_id = "{}_2021Y07M{:02d}D_{:02d}H00M00S_img".format(name, day + frame // 2, 12 * (frame % 2))
+        annotations = [{"label_id": label_id, "bbox": [10.0 * track_id, 10.0, 5.0 + frame, 5.0 + frame],
+                        "attributes": {"track_id": track_id}} for track_id, label_id in tracks.items()]
+        items.append({"id": plant_id, "annotations": annotations, "attr": {"frame": frame}})
+    return items
+
+
+@pytest.fixture
+def write_tray():
+    """Return a function (file_name, tracks, frames=3) that writes a Datumaro JSON file, see tray_items"""
+
+    def write(file_name, tracks: dict, frames=3):
+        name = os.path.splitext(os.path.basename(str(file_name)))[0]
+        with open(file_name, "w") as f:
+            json.dump({"info": {}, "categories": {}, "items": tray_items(name, tracks, frames)}, f)
+    return write
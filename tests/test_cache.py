@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+from cache import TrayCache
+from pipeline import Specie, read_tray_columns
+
+
+def cache_size(cache):
+    return sum(size for _, size, _ in cache.entries())
+
+
+def test_entry_is_invalid_after_a_change_of_the_file(tmp_path, write_tray):
+    file_name = str(tmp_path / "ZEAMX_000000.json")
+    write_tray(file_name, {0: 0})
+    cache = TrayCache(str(tmp_path / "cache"))
+    columns = read_tray_columns(file_name, cache)
+    cached = cache.load(file_name)
+    assert cached["plant_ids"] == columns["plant_ids"]
+    assert np.array_equal(cached["coordinates"], columns["coordinates"])
+
+    stat = os.stat(file_name)
+    os.utime(file_name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.load(file_name) is None
+
+    read_tray_columns(file_name, cache)
+    assert cache.load(file_name) is not None
+    with open(file_name, "a") as f:
+        f.write(" ")
+    os.utime(file_name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))  # same time, different size
+    assert cache.load(file_name) is None
+
+
+def test_store_keeps_the_cache_bounded(tmp_path, write_tray):
+    directory = tmp_path / "ZEAMX"
+    directory.mkdir()
+    for i in range(12):
+        write_tray(directory / "ZEAMX_{:06d}.json".format(i), {track_id: 0 for track_id in range(i + 1)})
+    cache = TrayCache(str(tmp_path / "cache"))
+    read_tray_columns(str(directory / "ZEAMX_000000.json"), cache)
+    entry_size = cache_size(cache)
+
+    cache = TrayCache(str(tmp_path / "cache"), max_bytes=4 * entry_size)
+    specie = Specie(str(directory), lazy=True, cache=cache)  # the lazy trays write to the cache one at a time
+    specie.totals()
+    assert 0 < cache_size(cache) <= cache.max_bytes
+    assert cache.load(specie.trays[-1].file_name) is not None  # the most recent entries are kept
+    assert cache.load(specie.trays[0].file_name) is None
@@ -0,0 +1,30 @@
+import json
+
+import pytest
+
+import cli
+
+
+@pytest.fixture
+def directory(tmp_path, write_tray):
+    directory = tmp_path / "ZEAMX"
+    directory.mkdir()
+    write_tray(directory / "ZEAMX_000000.json", {0: 0, 1: 1})
+    return str(directory)
+
+
+@pytest.mark.parametrize("where, message", [("label=x", "the label must be an integer"),
+                                            ("species=NOPE", "unknown species 'NOPE'"),
+                                            ("tray=ZEAMX_999999", "unknown tray 'ZEAMX_999999'"),
+                                            ("plant=1", "invalid filter")])
+def test_stats_invalid_where_is_a_usage_error(directory, where, message, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        cli.main(["stats", directory, "--where", where])
+    assert exit_info.value.code == 2
+    assert message in capsys.readouterr().err
+
+
+def test_stats_where(directory, capsys):
+    cli.main(["stats", directory, "--by", "label", "--where", "species=ZEAMX", "tray=ZEAMX_000000", "label=1"])
+    rows = json.loads(capsys.readouterr().out)
+    assert [(row["label"], row["wrong_plants"]) for row in rows] == [(1, 1)]
@@ -0,0 +1,18 @@
+from dataset import Dataset
+from pipeline import Specie
+
+
+def test_life_span_columns_count_the_correct_plants_like_tray_stats(tmp_path, write_tray):
+    directory = tmp_path / "ZEAMX"
+    directory.mkdir()
+    write_tray(directory / "ZEAMX_000000.json", {0: 0, 1: 1, 2: 0}, frames=4)
+    write_tray(directory / "ZEAMX_000001.json", {0: 1, 1: 0})
+    specie = Specie(str(directory))
+    dataset = Dataset([specie])
+
+    for row, tray in zip(dataset.query(("species", "tray")), specie.trays):
+        stats = specie.tray_stats(tray)
+        assert (row["life_spans"], row["life_span_hours_sum"], row["life_span_days_sum"]) == \
+            (stats.life_spans, stats.life_span_hours_sum, stats.life_span_days_sum)
+    wrong, = dataset.query(("label",), {"label": 1})
+    assert wrong["wrong_plants"] == 2 and wrong["life_spans"] == 0
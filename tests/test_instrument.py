@@ -0,0 +1,22 @@
+import pytest
+
+import instrument
+from cache import default_cache
+
+
+@pytest.mark.parametrize("value", ["", "0", "off", "OFF", "false", "no"])
+def test_environment_switches_off(value, monkeypatch):
+    monkeypatch.setenv("STATICROPS_INSTRUMENT", value)
+    monkeypatch.setenv("STATICROPS_CACHE", value)
+    assert instrument.enable_from_environment() is None
+    assert not instrument.enabled()
+    assert default_cache() is None
+
+
+def test_environment_switch_on(monkeypatch):
+    monkeypatch.setenv("STATICROPS_INSTRUMENT", "1")
+    try:
+        assert instrument.enable_from_environment() is not None
+        assert instrument.enabled()
+    finally:
+        instrument.disable()
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+import cli
+from partials import read_partials, write_partials
+from pipeline import Specie
+
+
+@pytest.fixture
+def species(tmp_path, write_tray):
+    directories = []
+    for name, trays in [("ZEAMX", [{0: 0, 1: 1}, {0: 0, 1: 0, 2: 0}, {0: 1}]), ("SORXX", [{0: 0}, {0: 0, 1: 1}])]:
+        directory = tmp_path / name
+        directory.mkdir()
+        for i, tracks in enumerate(trays):
+            write_tray(directory / "{}_{:06d}.json".format(name, i), tracks, frames=3 + i)
+        directories.append(str(directory))
+    return directories
+
+
+def run(argv, capsys):
+    cli.main(argv)
+    return json.loads(capsys.readouterr().out)
+
+
+def test_map_reduce_is_identical_to_a_single_run(species, tmp_path, capsys):
+    zeamx, sorxx = [Specie(directory) for directory in species]
+    # the trays of ZEAMX are split between the two machines
+    write_partials(str(tmp_path / "part-1.json"), [Specie(zeamx.directory, trays=zeamx.trays[:2])])
+    write_partials(str(tmp_path / "part-2.json"), [sorxx, Specie(zeamx.directory, trays=zeamx.trays[2:])])
+    merged = str(tmp_path / "merged.json")
+    write_partials(merged, read_partials([str(tmp_path / "part-1.json"), str(tmp_path / "part-2.json")]))
+
+    for command, options in [("stats", ["--by", "species", "tray", "label"]), ("stats", ["--by"]), ("trays", [])]:
+        assert run([command, "--partials", merged] + options, capsys) == run([command] + species + options, capsys)
+
+
+def test_read_partials_rejects_another_version(species, tmp_path):
+    file_name = str(tmp_path / "part.json")
+    write_partials(file_name, [Specie(species[0])])
+    with open(file_name) as f:
+        data = json.load(f)
+    data["version"] = 1
+    with open(file_name, "w") as f:
+        json.dump(data, f)
+    with pytest.raises(ValueError, match="unsupported partial aggregate version 1"):
+        read_partials([file_name])
@@ -0,0 +1,139 @@
+import os
+
+import pytest
+
+import pipeline
+from pipeline import Specie, TrayStats
+
+
+def bump(file_name):
+    """Change the modification time of a file so its signature changes"""
+
+    stat = os.stat(file_name)
+    os.utime(file_name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def summed_totals(specie):
+    totals = TrayStats()
+    for tray in specie.trays:
+        totals += tray.stats()
+    return totals
+
+
+def test_refresh_skips_a_half_written_file(tmp_path, write_tray):
+    directory = tmp_path / "ZEAMX"
+    directory.mkdir()
+    for i, tracks in enumerate([{0: 0, 1: 1}, {0: 0}, {0: 0, 1: 0, 2: 1}]):
+        write_tray(directory / "ZEAMX_00000{}.json".format(i), tracks)
+    state = str(tmp_path / "state.json")
+    Specie(str(directory), state=state).save_state()
+
+    specie = Specie(str(directory), lazy=True, state=state)
+    specie.totals()
+    os.remove(directory / "ZEAMX_000000.json")
+    write_tray(directory / "ZEAMX_000001.json", {0: 0, 1: 0, 2: 0, 3: 0}, frames=5)
+    bump(directory / "ZEAMX_000001.json")
+    half_written = directory / "ZEAMX_000003.json"
+    half_written.write_text('{"items": [')
+
+    with pytest.warns(UserWarning, match="ZEAMX_000003"):
+        result = specie.refresh()
+    assert result["removed"] == [str(directory / "ZEAMX_000000.json")]
+    assert result["changed"] == [str(directory / "ZEAMX_000001.json")]
+    assert result["added"] == []
+    assert list(result["errors"]) == [str(half_written)]
+    assert [tray.name for tray in specie.trays] == ["ZEAMX_000001", "ZEAMX_000002"]
+    assert specie.totals() == summed_totals(specie)
+    assert specie.totals().plants == 5 + 4  # number_plants is the largest track_id of the file + 2
+
+    # the same file is tried again on the next refresh, once complete
+    write_tray(half_written, {0: 0, 1: 1})
+    result = specie.refresh()
+    assert result == {"added": [str(half_written)], "changed": [], "removed": [], "errors": {}}
+    assert specie.totals() == summed_totals(specie)
+
+    os.remove(half_written)
+    assert specie.refresh()["removed"] == [str(half_written)]
+    assert specie.totals() == summed_totals(specie)
+    assert specie.refresh() == {"added": [], "changed": [], "removed": [], "errors": {}}
+
+
+def test_refresh_keeps_a_changed_tray_that_cannot_be_parsed(tmp_path, write_tray):
+    directory = tmp_path / "ZEAMX"
+    directory.mkdir()
+    write_tray(directory / "ZEAMX_000000.json", {0: 0, 1: 1})
+    specie = Specie(str(directory))
+    totals = specie.totals()
+
+    (directory / "ZEAMX_000000.json").write_text('{"items": [')
+    with pytest.warns(UserWarning):
+        result = specie.refresh()
+    assert result["changed"] == [] and list(result["errors"]) == [str(directory / "ZEAMX_000000.json")]
+    assert specie.totals() == totals
+
+    write_tray(directory / "ZEAMX_000000.json", {0: 0, 1: 0, 2: 0})
+    bump(directory / "ZEAMX_000000.json")
+    assert specie.refresh()["changed"] == [str(directory / "ZEAMX_000000.json")]
+    assert specie.totals() == summed_totals(specie)
+    assert specie.totals().correct_plants == 3
+
+
+def test_memoized_binds_keyword_arguments(tmp_path, write_tray):
+    directory = tmp_path / "ZEAMX"
+    directory.mkdir()
+    write_tray(directory / "ZEAMX_000000.json", {0: 0, 1: 1, 2: 0}, frames=4)
+    specie = Specie(str(directory))
+    tray = specie.trays[0]
+
+    assert tray.life_spans(unit="D").tolist() == [1.5, 1.5]
+    assert tray.life_spans(discriminate=False).tolist() == [36.0, 36.0, 36.0]
+    assert specie.life_spans(unit="D").tolist() == [1.5, 1.5]
+    assert tray.life_spans() is tray.life_spans("h") is tray.life_spans("h", True) is tray.life_spans(unit="h")
+    assert len([key for key in tray.memo if key[0] == "life_spans"]) == 3
+
+
+def test_file_changed_while_it_is_loaded_is_seen_by_refresh(tmp_path, write_tray, monkeypatch):
+    directory = tmp_path / "ZEAMX"
+    directory.mkdir()
+    file_name = directory / "ZEAMX_000000.json"
+    write_tray(file_name, {0: 0})
+    read_tray_columns = pipeline.read_tray_columns
+
+    def read_then_export_again(name, cache=None, stream=False):
+        columns = read_tray_columns(name, cache, stream)
+        write_tray(file_name, {0: 0, 1: 0, 2: 0})
+        bump(file_name)
+        return columns
+
+    monkeypatch.setattr(pipeline, "read_tray_columns", read_then_export_again)
+    specie = Specie(str(directory))
+    monkeypatch.setattr(pipeline, "read_tray_columns", read_tray_columns)
+    assert specie.count_type_plant() == [1, 0]
+    assert specie.refresh()["changed"] == [str(file_name)]
+    assert specie.count_type_plant() == [3, 0]
+
+
+def test_statistics_of_a_reloaded_tray(tmp_path, write_tray):
+    directory = tmp_path / "ZEAMX"
+    directory.mkdir()
+    file_name = directory / "ZEAMX_000000.json"
+    write_tray(file_name, {0: 0})
+    write_tray(directory / "ZEAMX_000001.json", {0: 0, 1: 1})
+    specie = Specie(str(directory))
+    assert specie.count_type_plant() == [2, 1]
+
+    tray = specie.trays[0]
+    write_tray(file_name, {0: 0, 1: 0, 2: 0})
+    bump(file_name)
+    tray.reload()
+    assert tray.count_type_plant() == [3, 0]
+    assert specie.refresh()["changed"] == [str(file_name)]
+    assert specie.count_type_plant() == [4, 1]
+
+    write_tray(file_name, {0: 0, 1: 0})
+    bump(file_name)
+    tray.reload()
+    assert specie.tray_stats(tray).correct_plants == 2
+    assert specie.count_type_plant() == [3, 1]
+    assert specie.refresh()["changed"] == []
+    assert specie.totals() == summed_totals(specie)
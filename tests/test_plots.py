@@ -0,0 +1,58 @@
+import os
+
+import matplotlib
+import numpy as np
+import pytest
+
+matplotlib.use("Agg")
+
+from pipeline import Specie  # noqa: E402
+from plots import (figure_avg_life_span_specie, figure_bbox_area_distribution,  # noqa: E402
+                   plot_average_time_annotation_per_tray_per_species, plot_avg_life_span_specie,
+                   plot_bbox_area_distribution)
+
+
+def test_avg_life_span_of_a_tray_without_life_spans(tmp_path, write_tray):
+    directory = tmp_path / "ZEAMX"
+    directory.mkdir()
+    write_tray(directory / "ZEAMX_000000.json", {0: 0, 1: 0}, frames=4)
+    write_tray(directory / "ZEAMX_000001.json", {0: 1})  # no correct plant
+    malformed = directory / "ZEAMX_000002.json"
+    write_tray(malformed, {0: 0})
+    malformed.write_text(malformed.read_text().replace("2021Y", "21Y"))
+    with pytest.warns(UserWarning, match="malformed"):
+        specie = Specie(str(directory))
+
+    figure = figure_avg_life_span_specie(specie)
+    assert figure["x"] == ["ZEAMX_000000", "ZEAMX_000001", "ZEAMX_000002"]
+    assert figure["y"][0] == 1.0 and figure["y"][1] != figure["y"][1] and figure["y"][2] != figure["y"][2]
+    plot_avg_life_span_specie(specie, False, str(tmp_path / "avg.png"))
+    assert (tmp_path / "avg.png").stat().st_size > 0
+
+
+def test_bbox_area_distribution_bins(tmp_path, write_tray):
+    directory = tmp_path / "ZEAMX"
+    directory.mkdir()
+    write_tray(directory / "ZEAMX_000000.json", {0: 0, 1: 1}, frames=5)
+    specie = Specie(str(directory))
+    areas = specie.bbox_areas()
+
+    figure = figure_bbox_area_distribution(specie)
+    assert figure["log_x"] and sum(figure["counts"]) == len(areas)
+    counts, edges = np.histogram(areas, bins=3)
+    figure = figure_bbox_area_distribution(specie, 3)
+    assert not figure["log_x"] and figure["counts"] == counts.tolist() and np.allclose(figure["edges"], edges)
+    figure = figure_bbox_area_distribution(specie, {"scale": "log", "low": 10, "high": 100, "bins": 2})
+    assert figure["log_x"] and figure["counts"] == [2, 8]  # areas 25 to 81, the edges are 10, 31.6 and 100
+
+    file_name = tmp_path / "areas.png"
+    plot_bbox_area_distribution(specie, 20, False, str(file_name))  # positional bins and show, as before
+    assert file_name.stat().st_size > 0
+
+
+def test_average_time_annotation_output_file_name(tmp_path):
+    csv_file_name = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "csv_files",
+                                 "annotation_time.csv")
+    file_name = tmp_path / "annotation_time.png"
+    plot_average_time_annotation_per_tray_per_species(csv_file_name, show=False, file_name=str(file_name))
+    assert file_name.stat().st_size > 0
@@ -0,0 +1,17 @@
+from pipeline import Specie
+
+
+def test_spatial_index_with_a_cell_size(tmp_path, write_tray):
+    directory = tmp_path / "ZEAMX"
+    directory.mkdir()
+    write_tray(directory / "ZEAMX_000000.json", {track_id: 0 for track_id in range(6)})
+    tray = Specie(str(directory)).trays[0]
+
+    index = tray.spatial_index(cell_size=50)
+    assert index.cell_size == 50
+    assert tray.spatial_index(50) is index
+    assert tray.spatial_index() is not index
+    # the bboxes of the frames are 10 pixels apart along x, from 5x5 to 7x7 pixels
+    assert index.region(0, 0, 12, 20, group=0).tolist() == [0, 1]
+    assert index.region(0, 0, 12, 20).tolist() == [0, 1, 6, 7, 12, 13]
+    assert index.nearest(52, 12, group=2).tolist() == [17]
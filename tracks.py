@@ -0,0 +1,163 @@
+"""
+Consistency checks of the tracks of the annotations.
+
+For every pair of consecutive observations of a track (the bbox of the track in one frame and in the next frame where
+the track is seen), track_transitions computes the IoU of the two bboxes, the displacement of their centers relative
+to their size, the ratio of their areas and the number of frames between them. The computation is vectorized over all
+the bboxes of a tray with the rows of its TrackIndex. Transitions beyond the thresholds are outliers: a bbox that jumps,
+grows or shrinks implausibly, or a track that disappears and reappears.
+
+Run from the root of the repository, e.g. in CI on a new annotation batch (the exit status is 1 if there are outliers):
+    python tracks.py ZEAMX SORXX --min-iou 0.2 --max-frame-gap 2
+"""
+
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from spatial import box_iou
+
+DEFAULT_THRESHOLDS = {
+    "min_iou": 0.01,  # IoU of the bboxes of consecutive observations
+    "max_displacement": 1.5,  # distance of the centers divided by the mean diagonal of the two bboxes
+    "max_area_ratio": 10.0,  # area of the larger bbox divided by the area of the smaller one
+    "max_frame_gap": 1,  # difference of the positions of the frames, 1 if the track is seen in consecutive frames
+}
+CHECKS = {"min_iou": ("iou", np.less), "max_displacement": ("displacement", np.greater),
+          "max_area_ratio": ("area_ratio", np.greater), "max_frame_gap": ("frame_gap", np.greater)}
+
+
+def track_transitions(tray):
+    """Return a dictionary of arrays with one entry per pair of consecutive observations of a track of a tray
+
+    The arrays are:
+        track_ids: track_id of the track
+        rows, next_rows: rows of the two bboxes in the columns of the tray
+        frame_index: position of the frame of the first bbox
+        frame_gap: number of frames between the two bboxes
+        iou: intersection over union of the two bboxes
+        displacement: distance of the centers of the bboxes divided by the mean of their diagonals
+        area_ratio: area of the larger bbox divided by the area of the smaller one (>= 1)
+
+    Parameters:
+        tray: a pipeline.Tray instance
+    """
+
+    tracks = tray.tracks
+    pairs = np.ones(max(len(tracks.rows) - 1, 0), dtype=bool)
+    pairs[tracks.offsets[1:-1] - 1] = False  # the last bbox of a track is not followed by a bbox of the same track
+    rows = tracks.rows[:-1][pairs]
+    next_rows = tracks.rows[1:][pairs]
+
+    x, y, width, height = tray.coordinates[rows].T
+    next_x, next_y, next_width, next_height = tray.coordinates[next_rows].T
+    area = width * height
+    next_area = next_width * next_height
+    distance = np.hypot(next_x + next_width / 2 - x - width / 2, next_y + next_height / 2 - y - height / 2)
+    diagonal = (np.hypot(width, height) + np.hypot(next_width, next_height)) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        displacement = np.where(diagonal > 0, distance / diagonal, np.inf)
+        area_ratio = np.maximum(area, next_area) / np.minimum(area, next_area)
+    area_ratio[np.isnan(area_ratio)] = 1.0  # two empty bboxes
+
+    return {
+        "track_ids": tray.track_ids[rows],
+        "rows": rows,
+        "next_rows": next_rows,
+        "frame_index": tray.frame_index[rows],
+        "frame_gap": tray.frame_index[next_rows] - tray.frame_index[rows],
+        "iou": box_iou(tray.coordinates[rows], tray.coordinates[next_rows]),
+        "displacement": displacement,
+        "area_ratio": area_ratio,
+    }
+
+
+def flag_outliers(transitions: dict, thresholds=None):
+    """Return {check: boolean array} with the transitions that fail every check of the thresholds
+
+    Parameters:
+        transitions: dictionary returned by track_transitions
+        thresholds: dictionary with some keys of DEFAULT_THRESHOLDS, the missing keys take the default value, a
+            threshold set to None is not checked
+    """
+
+    thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    flags = {}
+    for check, (column, compare) in CHECKS.items():
+        if thresholds[check] is not None:
+            flags[check] = compare(transitions[column], thresholds[check])
+    return flags
+
+
+def tray_outliers(tray, thresholds=None):
+    """Return a list with one dictionary per outlier transition of a tray
+
+    Every dictionary has the tray, the track_id, the ids of the two frames, the measures of the transition and the
+    list of the failed checks.
+
+    Parameters:
+        tray: a pipeline.Tray instance
+        thresholds: see flag_outliers
+    """
+
+    transitions = track_transitions(tray)
+    flags = flag_outliers(transitions, thresholds)
+    failed = np.zeros(len(transitions["rows"]), dtype=bool)
+    for mask in flags.values():
+        failed |= mask
+    outliers = []
+    for i in np.flatnonzero(failed):
+        outliers.append({
+            "tray": tray.name,
+            "track_id": int(transitions["track_ids"][i]),
+            "plant_id": tray.plant_ids[tray.frame_index[transitions["rows"][i]]],
+            "next_plant_id": tray.plant_ids[tray.frame_index[transitions["next_rows"][i]]],
+            "frame_gap": int(transitions["frame_gap"][i]),
+            "iou": float(transitions["iou"][i]),
+            "displacement": float(transitions["displacement"][i]),
+            "area_ratio": float(transitions["area_ratio"][i]),
+            "checks": [check for check, mask in flags.items() if mask[i]],
+        })
+    return outliers
+
+
+def specie_outliers(specie, thresholds=None):
+    """Return the outliers (see tray_outliers) of all the trays of a pipeline.Specie"""
+
+    return [outlier for tray in specie.trays for outlier in tray_outliers(tray, thresholds)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the consistency of the tracks of the given species directories")
+    parser.add_argument("directories", nargs="+", help="species directories")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes to parse the trays")
+    for check, default in DEFAULT_THRESHOLDS.items():
+        parser.add_argument("--" + check.replace("_", "-"), type=type(default), default=default)
+    parser.add_argument("--json", action="store_true", help="print the outliers as JSON lines")
+    args = parser.parse_args()
+
+    from cache import default_cache
+    from pipeline import load_species
+
+    thresholds = {check: getattr(args, check) for check in DEFAULT_THRESHOLDS}
+    number_of_outliers = 0
+    for specie in load_species(args.directories, args.workers, default_cache()):
+        outliers = specie_outliers(specie, thresholds)
+        number_of_outliers += len(outliers)
+        for outlier in outliers:
+            if args.json:
+                print(json.dumps(dict(outlier, species=specie.name)))
+            else:
+                print("{}/{} track {}: {} -> {} ({})".format(specie.name, outlier["tray"], outlier["track_id"],
+                                                            outlier["plant_id"], outlier["next_plant_id"],
+                                                            ", ".join(outlier["checks"])))
+        if not args.json:
+            print("{}: {} outliers".format(specie.name, len(outliers)))
+    sys.exit(1 if number_of_outliers else 0)
+
+
+if __name__ == "__main__":
+    main()